@@ -1,12 +1,13 @@
+import os
+import sys
 import numpy as np
 import pyroomacoustics as pra
 import matplotlib.pyplot as plt
-import scipy.signal as signal
 
-def calculate_frequency_response(rir, fs):
-    rir_norm = rir / np.max(np.abs(rir)) # normalize the RIR
-    freq, response = signal.freqz(rir_norm, fs=fs) # calculate the frequency response
-    return freq, response
+# the frequency response service lives with the Tk app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tk_folder'))
+from freq_response import frequency_responses
+from rir_bank import room_bank
 
 def plot_frequency_responses(freq_responses, mic_positions):
     fig, axs = plt.subplots(len(mic_positions), 1, figsize=(8, 4 * len(mic_positions))) # create a figure with one subplot per microphone
@@ -45,12 +46,9 @@ for mic_pos in mic_positions:
 
 room.compute_rir()
 
-freq_responses = []
+combined_rirs = room_bank(room).mixdown() # all sources combined, zero-padded (not wrapped around), one row per mic
 
-for mic_idx in range(len(mic_positions)): # for each microphone
-    MaxRIRLen = max(len(i) for i in room.rir[mic_idx]) # find the longest RIR
-    combined_rir = sum(np.resize(room.rir[mic_idx][src_idx], MaxRIRLen) for src_idx in range(len(src_positions))) # combine all sources
-    freq, response = calculate_frequency_response(combined_rir, room.fs) # calculate frequency response
-    freq_responses.append((freq, response))
+freq, responses = frequency_responses(combined_rirs, room.fs) # all the mics in one batched FFT
+freq_responses = [(freq, response) for response in responses]
 
 plot_frequency_responses(freq_responses, mic_positions)
@@ -1,12 +1,18 @@
+import os
+import sys
 import numpy as np
 import pyroomacoustics as pra
 import matplotlib.pyplot as plt
 import scipy.signal as signal
 
+# the RIR bank lives with the Tk app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tk_folder'))
+from rir_bank import room_bank
+
 def adding_rir(room, mic, sources):
     
-    MaxRIRLen = max(len(i) for i in room.rir[mic]) #max length of the RIRs of the sources
-    rirtot = sum(np.resize(room.rir[mic][i], MaxRIRLen) for i in sources) #sum of the RIRs of the sources #np.resize() is used to make the RIRs of the sources the same length
+    bank = room_bank(room) #all the RIRs zero-padded to the longest one, built once per room
+    rirtot = bank.data[mic, sources].sum(axis=0, dtype=np.float64) #sum of the RIRs of the sources, the padding adds zeros (np.resize wrapped the samples around)
 
     rirtot = rirtot / np.max(np.abs(rirtot))
     freq, response = signal.freqz(rirtot, fs=room.fs)
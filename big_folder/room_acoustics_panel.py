@@ -1,7 +1,13 @@
+import os
+import sys
 import numpy as np
 import pyroomacoustics as pra
 import matplotlib.pyplot as plt
-import scipy.signal as signal
+
+# the frequency response service lives with the Tk app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tk_folder'))
+from freq_response import frequency_responses
+from rir_bank import room_bank
 import panel as pn
 import holoviews as hv
 
@@ -35,11 +41,6 @@ class Source:
         self.position = position
 
 
-def calculate_frequency_response(rir, fs):
-    rir_norm = rir / np.max(np.abs(rir)) # normalize the RIR
-    freq, response = signal.freqz(rir_norm, fs=fs) # calculate the frequency response
-    return freq, response
-
 def plot_frequency_responses(freq_responses):
     plots = []
     for i, (freq, response) in enumerate(freq_responses): # i is the mic index
@@ -58,15 +59,10 @@ def compute_responses(room_dim, absorption, mic_positions, src_positions):
 
     room.compute_rir()
 
-    freq_responses = []
-
-    for mic_idx in range(len(mic_positions)): # for each microphone
-        MaxRIRLen = max(len(i) for i in room.rir[mic_idx]) # find the longest RIR
-        combined_rir = sum(np.resize(room.rir[mic_idx][src_idx], MaxRIRLen) for src_idx in range(len(src_positions))) # combine all sources
-        freq, response = calculate_frequency_response(combined_rir, room.fs) # calculate frequency response
-        freq_responses.append((freq, response))
+    combined_rirs = room_bank(room).mixdown() # all sources combined, zero-padded (not wrapped around), one row per mic
 
-    return freq_responses
+    freq, responses = frequency_responses(combined_rirs, room.fs) # all the mics in one batched FFT, cached
+    return [(freq, response) for response in responses]
 
 def update(event):
     room_dim = room_dim_input.value
@@ -86,13 +82,10 @@ def update(event):
 
     room.compute_rir()
 
-    freq_responses = []
+    combined_rirs = room_bank(room.room).mixdown() # all sources combined, zero-padded (not wrapped around), one row per mic
 
-    for mic_idx in range(len(microphones)): # for each microphone
-        MaxRIRLen = max(len(room.get_rir(mic_idx, src_idx)) for src_idx in range(len(sources))) # find the longest RIR
-        combined_rir = sum(np.resize(room.get_rir(mic_idx, src_idx), MaxRIRLen) for src_idx in range(len(sources))) # combine all sources
-        freq, response = calculate_frequency_response(combined_rir, room.get_fs()) # calculate frequency response
-        freq_responses.append((freq, response))
+    freq, responses = frequency_responses(combined_rirs, room.get_fs()) # all the mics in one batched FFT, cached
+    freq_responses = [(freq, response) for response in responses]
 
     plots = plot_frequency_responses(freq_responses)
     plot_pane.object = hv.Layout(plots).cols(1)
@@ -0,0 +1,538 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pyroomacoustics as pra
+
+# the acoustic parameters live with the Tk app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tk_folder'))
+from room_metrics import METRICS, acoustic_parameters
+from rir_bank import create_bank_file, open_bank_file, write_bank_header
+from rir_cache import scene_hash
+
+# room of the current worker process, see _init_worker
+_worker_room = None
+# writable on-disk banks of the current process, by path, see chunk_bank_file
+_bank_files = {}
+
+
+def grid_points(x, y, z):
+    """Stack the points of a 3D grid into microphone coordinates.
+
+    Parameters
+    ----------
+    x, y, z : ndarray
+        The grid coordinates along each axis.
+
+    Returns
+    -------
+    points : ndarray
+        The grid points, shape (3, nx * ny * nz), in 'ij' order.
+    """
+    X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
+    return np.stack([X.ravel(), Y.ravel(), Z.ravel()])
+
+
+def build_room(room_dim, absorption, src_positions, points, fs=16000, max_order=3):
+    """Build the room once with every grid point as a microphone.
+
+    The image sources of every source (and their visibility from every grid
+    point) are computed here, so they can be reused for the whole grid.
+
+    Parameters
+    ----------
+    room_dim : list
+        The dimensions of the room.
+    absorption : float
+        The absorption coefficient of the room.
+    src_positions : ndarray
+        The source positions, shape (n_src, 3).
+    points : ndarray
+        The grid points, shape (3, n_points).
+    fs : int
+        The sampling frequency.
+    max_order : int
+        The maximum reflection order of the room.
+
+    Returns
+    -------
+    room : pyroomacoustics.ShoeBox
+        The room object with its image sources computed.
+    """
+    room = pra.ShoeBox(room_dim, fs=fs, absorption=absorption, max_order=max_order)
+    room.add_microphone_array(pra.MicrophoneArray(points, room.fs))
+
+    for src_pos in src_positions:
+        room.add_source(src_pos)
+
+    room.image_source_model()
+    return room
+
+
+def image_source_rirs(room: pra.ShoeBox, mic_idx):
+    """Build the image source RIRs of a batch of grid points in one pass.
+
+    Same construction as pyroomacoustics (windowed sinc fractional delays),
+    without the per pair Python loop of ``room.compute_rir()``.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.ShoeBox
+        The room returned by ``build_room``.
+    mic_idx : ndarray
+        The indices of the grid points to compute.
+
+    Returns
+    -------
+    rirs : ndarray
+        The room impulse responses, shape (len(mic_idx), n_src, n_samples).
+    """
+    fdl = pra.constants.get('frac_delay_length')
+    fdl2 = fdl // 2
+    taps = np.arange(-fdl2, fdl2 + 1)
+    window = np.hanning(fdl)
+    mics = room.mic_array.R[:, mic_idx]
+
+    # distances and delays of every (point, source, image), in samples
+    delays = []
+    alphas = []
+    for src_idx, src in enumerate(room.sources):
+        dist = np.sqrt(np.sum((src.images[:, None, :] - mics[:, :, None]) ** 2, axis=0))
+        # keep the direct path finite for grid points on top of a source
+        dist = np.maximum(dist, room.c / room.fs)
+        visible = room.visibility[src_idx][mic_idx, :]
+        delays.append(dist / room.c * room.fs + fdl2)
+        alphas.append(src.damping[0, :] / dist * visible)
+
+    n_samples = int(np.ceil(max(d.max() for d in delays))) + fdl + 1
+    n_mics = len(mic_idx)
+    rirs = np.zeros((n_mics, len(room.sources), n_samples))
+
+    for src_idx in range(len(room.sources)):
+        time_ip = np.floor(delays[src_idx]).astype(int)
+        time_fp = delays[src_idx] - time_ip
+        filters = alphas[src_idx][..., None] * window * np.sinc(taps - time_fp[..., None])
+        # scatter-add every filter in its row, all points at once
+        index = time_ip[..., None] + taps + (np.arange(n_mics) * n_samples)[:, None, None]
+        rirs[:, src_idx, :] = np.bincount(index.ravel(), weights=filters.ravel(), minlength=n_mics * n_samples).reshape(n_mics, n_samples)
+
+    return rirs
+
+
+def image_source_energy(room: pra.ShoeBox, mic_idx):
+    """Compute the RIR energy of a batch of grid points in closed form.
+
+    Each image source contributes (damping / distance)^2. Image sources that
+    arrive less than a sample apart (e.g. mirrored pairs for points on a wall)
+    add up coherently in the RIR, so their cross terms are added too, weighted
+    by sinc(delay difference). No RIR is synthesized.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.ShoeBox
+        The room returned by ``build_room``.
+    mic_idx : ndarray
+        The indices of the grid points to compute.
+
+    Returns
+    -------
+    energy : ndarray
+        The RIR energy, shape (len(mic_idx), n_src).
+    """
+    mics = room.mic_array.R[:, mic_idx]
+    energy = np.zeros((len(mic_idx), len(room.sources)))
+
+    for src_idx, src in enumerate(room.sources):
+        dist = np.sqrt(np.sum((src.images[:, None, :] - mics[:, :, None]) ** 2, axis=0))
+        dist = np.maximum(dist, room.c / room.fs)
+        visible = room.visibility[src_idx][mic_idx, :]
+        alpha = src.damping[0, :] / dist * visible
+        delay = dist / room.c * room.fs
+
+        energy[:, src_idx] = np.sum(np.square(alpha), axis=-1)
+
+        # sort the arrivals, then pair each one with the next ones until they
+        # are more than a sample apart
+        order = np.argsort(delay, axis=-1)
+        delay = np.take_along_axis(delay, order, axis=-1)
+        alpha = np.take_along_axis(alpha, order, axis=-1)
+        for k in range(1, delay.shape[1]):
+            diff = delay[:, k:] - delay[:, :-k]
+            close = diff < 1
+            if not np.any(close):
+                break
+            cross = alpha[:, k:] * alpha[:, :-k] * np.sinc(diff) * close
+            energy[:, src_idx] += 2 * np.sum(cross, axis=-1)
+
+    return energy
+
+
+def chunk_energy(room: pra.ShoeBox, mic_idx, mode='rir'):
+    """Compute the RIR energy of a batch of grid points.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.ShoeBox
+        The room returned by ``build_room``.
+    mic_idx : ndarray
+        The indices of the grid points to compute.
+    mode : str
+        'rir' to sum the squared samples of the synthesized RIRs,
+        'energy' to use the closed form of ``image_source_energy``.
+
+    Returns
+    -------
+    energy : ndarray
+        The RIR energy, shape (len(mic_idx), n_src).
+    """
+    if mode == 'energy':
+        return image_source_energy(room, mic_idx)
+    rirs = image_source_rirs(room, mic_idx)
+    return np.sum(np.square(rirs), axis=-1)
+
+
+def energy_envelope(rirs, frame_len, n_frames):
+    """Bin the squared RIRs into consecutive time windows.
+
+    RIRs shorter than ``n_frames * frame_len`` give empty trailing windows,
+    longer ones are cut, so RIRs of any length can be binned.
+
+    Parameters
+    ----------
+    rirs : ndarray
+        The room impulse responses, time along the last axis.
+    frame_len : int
+        The number of samples per window.
+    n_frames : int
+        The number of windows.
+
+    Returns
+    -------
+    envelope : ndarray
+        The energy of each window, shape rirs.shape[:-1] + (n_frames,).
+    """
+    n_samples = rirs.shape[-1]
+    envelope = np.zeros(rirs.shape[:-1] + (n_frames,), dtype=np.float32)
+    if n_samples == 0:
+        return envelope
+
+    # cumulative energy at the end of each window, then the difference
+    cum_energy = np.cumsum(np.square(rirs), axis=-1)
+    edges = np.minimum(np.arange(1, n_frames + 1) * frame_len, n_samples) - 1
+    envelope[...] = np.diff(cum_energy[..., edges], axis=-1, prepend=0)
+    return envelope
+
+
+def chunk_envelope(room: pra.ShoeBox, mic_idx, frame_len, n_frames):
+    """Compute the time binned RIR energy of a batch of grid points.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.ShoeBox
+        The room returned by ``build_room``.
+    mic_idx : ndarray
+        The indices of the grid points to compute.
+    frame_len : int
+        The number of samples per window.
+    n_frames : int
+        The number of windows.
+
+    Returns
+    -------
+    envelope : ndarray
+        The energy of each window summed over the sources,
+        shape (len(mic_idx), n_frames).
+    """
+    rirs = image_source_rirs(room, mic_idx)
+    return np.sum(energy_envelope(rirs, frame_len, n_frames), axis=1)
+
+
+def chunk_parameters(room: pra.ShoeBox, mic_idx):
+    """Compute the room acoustic parameters of a batch of grid points.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.ShoeBox
+        The room returned by ``build_room``.
+    mic_idx : ndarray
+        The indices of the grid points to compute.
+
+    Returns
+    -------
+    parameters : ndarray
+        The parameters of room_metrics.METRICS, in that order,
+        shape (len(mic_idx), n_src, len(METRICS)).
+    """
+    rirs = image_source_rirs(room, mic_idx)
+    parameters = acoustic_parameters(rirs.reshape(-1, rirs.shape[-1]), room.fs)
+    return np.stack([parameters[name] for name in METRICS], axis=-1).reshape(rirs.shape[:2] + (len(METRICS),))
+
+
+def chunk_bank_file(room: pra.ShoeBox, mic_idx, path):
+    """Write the RIRs of a batch of grid points into an on-disk bank.
+
+    The bank is opened once per process and the rows of ``mic_idx`` are
+    written in place, nothing but the valid lengths goes back to the caller.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.ShoeBox
+        The room returned by ``build_room``.
+    mic_idx : ndarray
+        The indices of the grid points to compute (consecutive).
+    path : str
+        The bank directory, made by rir_bank.create_bank_file.
+
+    Returns
+    -------
+    lengths : ndarray
+        The valid length of each RIR, shape (len(mic_idx), n_src).
+    """
+    if path not in _bank_files:
+        _bank_files[path] = open_bank_file(path, mode='r+').data
+    data = _bank_files[path]
+
+    rirs = image_source_rirs(room, mic_idx)
+    n_samples = min(rirs.shape[-1], data.shape[-1])
+    data[mic_idx[0]:mic_idx[-1] + 1, :, :n_samples] = rirs[..., :n_samples]
+    # up to the last non zero sample
+    nonzero = rirs[..., :n_samples] != 0
+    return np.where(nonzero.any(axis=-1), n_samples - np.argmax(nonzero[..., ::-1], axis=-1), 0)
+
+
+def _max_rir_length(room: pra.ShoeBox, points):
+    # longest RIR of image_source_rirs over the grid: the farthest point of
+    # the grid box from an image source is one of its corners
+    fdl = pra.constants.get('frac_delay_length')
+    corners = np.array(np.meshgrid(*zip(points.min(axis=1), points.max(axis=1)), indexing='ij')).reshape(3, -1)
+    max_dist = max(np.sqrt(np.sum((src.images[:, None, :] - corners[:, :, None]) ** 2, axis=0)).max() for src in room.sources)
+    max_dist = max(max_dist, room.c / room.fs)
+    return int(np.ceil(max_dist / room.c * room.fs + fdl // 2)) + fdl + 1
+
+
+def _init_worker(room_dim, absorption, src_positions, points, fs, max_order):
+    # the room can't be pickled, each worker builds its own copy once
+    global _worker_room
+    _worker_room = build_room(room_dim, absorption, src_positions, points, fs=fs, max_order=max_order)
+
+
+def _worker_chunk(chunk_fn, mic_idx, kwargs):
+    return mic_idx, chunk_fn(_worker_room, mic_idx, **kwargs)
+
+
+def _sweep_grid(room_dim, absorption, src_positions, points, chunk_fn, out, fs, max_order, chunk_size, n_workers, progress_callback, **kwargs):
+    # evaluate chunk_fn over the grid points chunk by chunk and fill out
+    n_points = points.shape[1]
+    chunks = [np.arange(start, min(start + chunk_size, n_points)) for start in range(0, n_points, chunk_size)]
+    done = 0
+
+    if n_workers == 1:
+        room = build_room(room_dim, absorption, src_positions, points, fs=fs, max_order=max_order)
+        for mic_idx in chunks:
+            out[mic_idx] = chunk_fn(room, mic_idx, **kwargs)
+            done += len(mic_idx)
+            if progress_callback:
+                progress_callback(100 * done / n_points)
+    else:
+        init_args = (room_dim, absorption, np.asarray(src_positions), points, fs, max_order)
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=init_args) as executor:
+            futures = [executor.submit(_worker_chunk, chunk_fn, mic_idx, kwargs) for mic_idx in chunks]
+            for future in as_completed(futures):
+                mic_idx, chunk = future.result()
+                out[mic_idx] = chunk
+                done += len(mic_idx)
+                if progress_callback:
+                    progress_callback(100 * done / n_points)
+
+    return out
+
+
+def compute_energy_field(room_dim, absorption, src_positions, x, y, z, fs=16000, max_order=3, chunk_size=256, mode='rir', n_workers=1, progress_callback=None):
+    """Compute the RIR energy of every source at every point of a grid.
+
+    The room and its image sources are built once, then the energy is
+    evaluated for ``chunk_size`` grid points at a time. With ``n_workers``
+    greater than 1 the chunks are spread over a process pool and written
+    into the result as they complete.
+
+    Scripts using ``n_workers`` > 1 must call this from an
+    ``if __name__ == '__main__':`` block (the workers re-import the script).
+
+    Parameters
+    ----------
+    room_dim : list
+        The dimensions of the room.
+    absorption : float
+        The absorption coefficient of the room.
+    src_positions : ndarray
+        The source positions, shape (n_src, 3).
+    x, y, z : ndarray
+        The grid coordinates along each axis.
+    fs : int
+        The sampling frequency.
+    max_order : int
+        The maximum reflection order of the room.
+    chunk_size : int
+        The number of grid points per batch, bounds the memory used.
+    mode : str
+        'rir' to sum the squared samples of the synthesized RIRs,
+        'energy' to use the closed form of ``image_source_energy``.
+    n_workers : int or None
+        The number of worker processes, None for one per CPU.
+    progress_callback : callable, optional
+        Called with the percentage of grid points done.
+
+    Returns
+    -------
+    energy : ndarray
+        The RIR energy, shape (nx, ny, nz, n_src).
+    """
+    if mode not in ('rir', 'energy'):
+        raise ValueError(f"Unknown mode '{mode}', expected 'rir' or 'energy'")
+
+    points = grid_points(x, y, z)
+    energy = np.zeros((points.shape[1], len(src_positions)))
+    _sweep_grid(room_dim, absorption, src_positions, points, chunk_energy, energy, fs, max_order, chunk_size, n_workers, progress_callback, mode=mode)
+    return energy.reshape(len(x), len(y), len(z), len(src_positions))
+
+
+def compute_energy_envelopes(room_dim, absorption, src_positions, x, y, z, frame_len, n_frames, fs=16000, max_order=3, chunk_size=256, n_workers=1, progress_callback=None):
+    """Compute the time binned RIR energy at every point of a grid.
+
+    Same sweep as ``compute_energy_field``, but each RIR is reduced to the
+    energy of ``n_frames`` windows of ``frame_len`` samples, summed over
+    the sources.
+
+    Parameters
+    ----------
+    room_dim : list
+        The dimensions of the room.
+    absorption : float
+        The absorption coefficient of the room.
+    src_positions : ndarray
+        The source positions, shape (n_src, 3).
+    x, y, z : ndarray
+        The grid coordinates along each axis.
+    frame_len : int
+        The number of samples per window.
+    n_frames : int
+        The number of windows.
+    fs : int
+        The sampling frequency.
+    max_order : int
+        The maximum reflection order of the room.
+    chunk_size : int
+        The number of grid points per batch, bounds the memory used.
+    n_workers : int or None
+        The number of worker processes, None for one per CPU.
+    progress_callback : callable, optional
+        Called with the percentage of grid points done.
+
+    Returns
+    -------
+    envelopes : ndarray
+        The energy of each window, float32, shape (nx, ny, nz, n_frames).
+    """
+    points = grid_points(x, y, z)
+    envelopes = np.zeros((points.shape[1], n_frames), dtype=np.float32)
+    _sweep_grid(room_dim, absorption, src_positions, points, chunk_envelope, envelopes, fs, max_order, chunk_size, n_workers, progress_callback, frame_len=frame_len, n_frames=n_frames)
+    return envelopes.reshape(len(x), len(y), len(z), n_frames)
+
+
+def compute_acoustic_parameters(room_dim, absorption, src_positions, x, y, z, fs=16000, max_order=3, chunk_size=256, n_workers=1, progress_callback=None):
+    """Compute the room acoustic parameters at every point of a grid.
+
+    Same sweep as ``compute_energy_field``, each chunk of RIRs goes through
+    room_metrics.acoustic_parameters in one batch.
+
+    Parameters
+    ----------
+    room_dim : list
+        The dimensions of the room.
+    absorption : float
+        The absorption coefficient of the room.
+    src_positions : ndarray
+        The source positions, shape (n_src, 3).
+    x, y, z : ndarray
+        The grid coordinates along each axis.
+    fs : int
+        The sampling frequency.
+    max_order : int
+        The maximum reflection order of the room. Low orders truncate the
+        decay, RT60 and EDT are then NaN or underestimated.
+    chunk_size : int
+        The number of grid points per batch, bounds the memory used.
+    n_workers : int or None
+        The number of worker processes, None for one per CPU.
+    progress_callback : callable, optional
+        Called with the percentage of grid points done.
+
+    Returns
+    -------
+    parameters : dict
+        One array per name of room_metrics.METRICS ('rt60', 'edt', 'c50',
+        'd50', 'drr'), shape (nx, ny, nz, n_src).
+    """
+    points = grid_points(x, y, z)
+    values = np.zeros((points.shape[1], len(src_positions), len(METRICS)))
+    _sweep_grid(room_dim, absorption, src_positions, points, chunk_parameters, values, fs, max_order, chunk_size, n_workers, progress_callback)
+    return {name: values[..., i].reshape(len(x), len(y), len(z), len(src_positions)) for i, name in enumerate(METRICS)}
+
+
+def compute_rir_bank(room_dim, absorption, src_positions, x, y, z, path, fs=16000, max_order=3, chunk_size=256, n_workers=1, progress_callback=None):
+    """Compute the RIRs of every source at every point of a grid into an on-disk bank.
+
+    Same sweep as ``compute_energy_field``, the RIRs are written by the
+    workers straight into a memory mapped float32 file (see
+    rir_bank.create_bank_file), so the grid never has to fit in memory. The
+    JSON header (shape, fs, valid lengths, scene hash) is written last.
+
+    Reopen the bank later with rir_bank.open_bank_file(path): slices of
+    ``bank.data`` are read from disk on demand.
+
+    Parameters
+    ----------
+    room_dim : list
+        The dimensions of the room.
+    absorption : float
+        The absorption coefficient of the room.
+    src_positions : ndarray
+        The source positions, shape (n_src, 3).
+    x, y, z : ndarray
+        The grid coordinates along each axis.
+    path : str
+        The bank directory, overwritten if it exists.
+    fs : int
+        The sampling frequency.
+    max_order : int
+        The maximum reflection order of the room.
+    chunk_size : int
+        The number of grid points per batch, bounds the memory used.
+    n_workers : int or None
+        The number of worker processes, None for one per CPU.
+    progress_callback : callable, optional
+        Called with the percentage of grid points done.
+
+    Returns
+    -------
+    bank : rir_bank.RIRBank
+        The read-only bank, shape (nx * ny * nz, n_src, L), grid points in
+        'ij' order.
+    """
+    points = grid_points(x, y, z)
+    scene = {'room_dim': room_dim, 'absorption': absorption, 'src_positions': src_positions,
+             'x': x, 'y': y, 'z': z, 'fs': fs, 'max_order': max_order}
+    room = build_room(room_dim, absorption, src_positions, points, fs=fs, max_order=max_order)
+    shape = (points.shape[1], len(src_positions), _max_rir_length(room, points))
+    create_bank_file(path, shape, fs, scene_hash(scene))
+
+    lengths = np.zeros(shape[:2], dtype=np.int64)
+    try:
+        _sweep_grid(room_dim, absorption, src_positions, points, chunk_bank_file, lengths, fs, max_order, chunk_size, n_workers, progress_callback, path=path)
+    finally:
+        # flushes and closes the memmap of this process
+        _bank_files.pop(path, None)
+
+    write_bank_header(path, shape, fs, lengths, scene_hash(scene))
+    return open_bank_file(path)
@@ -1,5 +1,5 @@
 import numpy as np
-import pyroomacoustics as pra
+from energy_field import compute_energy_envelopes
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 
@@ -7,6 +7,8 @@ room_dim = [5, 4, 3]
 absorption = 0.5
 fs = 16000
 time_step = 0.01  # time step in seconds
+duration = 0.1  # animated part of the RIRs in seconds
+n_workers = None # worker processes for the grid sweep, None for one per CPU
 
 src_positions = np.array([
     [1, 1, 1.5],
@@ -19,30 +21,8 @@ y = np.linspace(0, room_dim[1], 11)
 z = np.linspace(0, room_dim[2], 11)
 X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
 
-n_time_frames = int(fs * time_step)
-
-sound_level_time = np.zeros((len(x), len(y), len(z), n_time_frames))
-
-for i, xi in enumerate(x):
-    for j, yj in enumerate(y):
-        for k, zk in enumerate(z):
-            room = pra.ShoeBox(room_dim, fs=fs, absorption=absorption, max_order=3)
-            mic_pos = np.array([xi, yj, zk])
-            room.add_microphone(mic_pos)
-
-            for src_pos in src_positions:
-                room.add_source(src_pos)
-
-            room.compute_rir()
-
-            for src_idx in range(len(src_positions)):
-                rir = room.rir[0][src_idx]
-                for t in range(n_time_frames):
-                    sound_level_time[i, j, k, t] += rir[t] ** 2
-
-sound_level_time /= np.max(sound_level_time)
-
-fig, axs = plt.subplots(1, len(z), figsize=(10 * len(z), 10), sharey=True)
+frame_len = int(fs * time_step) # samples per time frame
+n_time_frames = int(round(duration / time_step))
 
 def plot_2d_slice(ax, plane_data, plane, fixed_axis_val, src_positions, room_dim, cmap='viridis'): 
     # Plot the 2D slice of the sound level
@@ -57,17 +37,25 @@ def plot_2d_slice(ax, plane_data, plane, fixed_axis_val, src_positions, room_dim
     ax.set_title(f'{plane}-plane at {fixed_axis_val}')
     return im # Return the image so we can add a colorbar
 
-def update(frame):
-    for k, zk in enumerate(z):
-        axs[k].clear()
-        im = plot_2d_slice(axs[k], sound_level_time[:, :, k, frame].T, 'XY', zk, src_positions, room_dim, cmap='viridis')
-        axs[k].set_title(f'Z = {zk:.1f} | Frame: {frame}')
-        if k > 0:
-            axs[k].set_ylabel("")
-        if k > 0:
-            axs[k].set_title(f'{zk:.1f}')
+if __name__ == '__main__': # the sweep workers re-import this script
+    # Energy of each time frame at each grid point, summed over the sources
+    sound_level_time = compute_energy_envelopes(room_dim, absorption, src_positions, x, y, z, frame_len, n_time_frames, fs=fs, max_order=3,
+                                                n_workers=n_workers, progress_callback=lambda p: print(f'{p:.0f}%'))
+    sound_level_time /= np.max(sound_level_time)
+
+    fig, axs = plt.subplots(1, len(z), figsize=(10 * len(z), 10), sharey=True)
+
+    def update(frame):
+        for k, zk in enumerate(z):
+            axs[k].clear()
+            im = plot_2d_slice(axs[k], sound_level_time[:, :, k, frame].T, 'XY', zk, src_positions, room_dim, cmap='viridis')
+            axs[k].set_title(f'Z = {zk:.1f} | Frame: {frame}')
+            if k > 0:
+                axs[k].set_ylabel("")
+            if k > 0:
+                axs[k].set_title(f'{zk:.1f}')
 
 
-ani = animation.FuncAnimation(fig, update, frames=n_time_frames, interval=50, repeat=True)
+    ani = animation.FuncAnimation(fig, update, frames=n_time_frames, interval=50, repeat=True)
 
-plt.show()
+    plt.show()
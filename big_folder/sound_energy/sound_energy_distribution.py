@@ -1,10 +1,11 @@
 import numpy as np
-import pyroomacoustics as pra
+from energy_field import compute_energy_field
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 
 room_dim = [5, 4, 3]
 absorption = 0.5
+n_workers = None # worker processes for the grid sweep, None for one per CPU
 
 src_positions = np.array([
     [1, 1, 1.5],
@@ -18,43 +19,32 @@ y = np.linspace(0, room_dim[1], 11)
 z = np.linspace(0, room_dim[2], 11)
 X, Y, Z = np.meshgrid(x, y, z, indexing='ij') # 3D grid
 
-# Calculate the sound level at each point in the grid
-sound_level = np.zeros_like(X)
+if __name__ == '__main__': # the sweep workers re-import this script
+    # Calculate the sound level at each point in the grid
+    # The room and its image sources are built once for the whole grid
+    # mode='energy' skips the RIR synthesis, use mode='rir' to sum the squared RIRs
+    energy = compute_energy_field(room_dim, absorption, src_positions, x, y, z, fs=16000, max_order=3, mode='energy',
+                                  n_workers=n_workers, progress_callback=lambda p: print(f'{p:.0f}%'))
+    sound_level = np.sum(energy, axis=-1) # Sound energy
 
-for i, xi in enumerate(x):
-    for j, yj in enumerate(y):
-        for k, zk in enumerate(z):
-            room = pra.ShoeBox(room_dim, fs=16000, absorption=absorption, max_order=3)
-            mic_pos = np.array([xi, yj, zk])
-            room.add_microphone(mic_pos)
+    # Normalize sound level
+    sound_level /= np.max(sound_level)
 
-            for src_pos in src_positions:
-                room.add_source(src_pos)
+    # Create a 3D scatter plot
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111, projection='3d')
 
-            room.compute_rir()
-            for src_idx in range(len(src_positions)):
-                rir = room.rir[0][src_idx]
-                sound_level[i, j, k] += np.sum(np.square(rir)) # Sound energy
+    for src_pos in src_positions:
+        ax.scatter(*src_pos, color='red', marker='x', s=100) # Source position
 
-# Normalize sound level
-sound_level /= np.max(sound_level)
+    scatter = ax.scatter(X, Y, Z, c=sound_level.flatten(), cmap='viridis', alpha=0.5)
 
-# Create a 3D scatter plot
-fig = plt.figure(figsize=(10, 8))
-ax = fig.add_subplot(111, projection='3d')
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    ax.set_title('3D Scatter Plot of Sound Level in the Room')
 
-for src_pos in src_positions:
-    ax.scatter(*src_pos, color='red', marker='x', s=100) # Source position
-
-scatter = ax.scatter(X, Y, Z, c=sound_level.flatten(), cmap='viridis', alpha=0.5)
-
-ax.set_xlabel('X')
-ax.set_ylabel('Y')
-ax.set_zlabel('Z')
-ax.set_title('3D Scatter Plot of Sound Level in the Room')
-
-cbar = plt.colorbar(scatter, ax=ax)
-cbar.set_label('Normalized Sound Level')
-
-plt.show()
+    cbar = plt.colorbar(scatter, ax=ax)
+    cbar.set_label('Normalized Sound Level')
 
+    plt.show()
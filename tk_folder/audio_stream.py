@@ -0,0 +1,130 @@
+from math import gcd
+import numpy as np
+import scipy.signal as signal
+import soundfile as sf
+
+
+class StreamingResampler:
+    """Polyphase resampler keeping its state between blocks.
+
+    Uses the same anti-aliasing filter as scipy.signal.resample_poly, so
+    resampling a signal block by block gives the same samples as resampling
+    it at once.
+
+    Parameters
+    ----------
+    fs_in : int
+        The input sampling frequency.
+    fs_out : int
+        The output sampling frequency.
+    half_len : int
+        The half length of the filter, in periods of the highest rate.
+    """
+
+    def __init__(self, fs_in: int, fs_out: int, half_len: int = 10):
+        g = gcd(int(fs_in), int(fs_out))
+        self.up = int(fs_out) // g
+        self.down = int(fs_in) // g
+
+        max_rate = max(self.up, self.down)
+        n_taps = 2 * half_len * max_rate + 1
+        h = signal.firwin(n_taps, 1. / max_rate, window=('kaiser', 5.0)) * self.up
+        # group delay of the filter, in upsampled samples
+        self.delay = (n_taps - 1) // 2
+
+        # polyphase components: phases[p, q] = h[p + up * q]
+        self.n_phase_taps = -(-n_taps // self.up)
+        h = np.pad(h, (0, self.n_phase_taps * self.up - n_taps))
+        self.phases = h.reshape(self.n_phase_taps, self.up).T
+
+        # input history, starting at input index buffer_start (zeros before 0)
+        self.buffer = np.zeros(self.n_phase_taps)
+        self.buffer_start = -self.n_phase_taps
+        self.n_in = 0
+        self.n_out = 0
+
+    def process(self, block: np.ndarray, final: bool = False):
+        """Resample the next input block.
+
+        Parameters
+        ----------
+        block : ndarray
+            The next input samples.
+        final : bool
+            True for the last block, flushes the filter.
+
+        Returns
+        -------
+        output : ndarray
+            The output samples available so far.
+        """
+        self.buffer = np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+
+        if final:
+            n_end = -(-self.n_in * self.up // self.down)
+            # the filter reads past the end of the input, pad with zeros
+            self.buffer = np.concatenate([self.buffer, np.zeros(self.delay // self.up + 2)])
+        else:
+            # outputs whose newest input sample has arrived
+            n_end = (self.n_in * self.up - 1 - self.delay) // self.down + 1
+        n_end = max(n_end, self.n_out)
+
+        m = np.arange(self.n_out, n_end)
+        position = m * self.down + self.delay
+        phase = position % self.up
+        newest = position // self.up - self.buffer_start
+        window = self.buffer[newest[:, None] - np.arange(self.n_phase_taps)]
+        output = np.sum(self.phases[phase] * window, axis=1)
+        self.n_out = n_end
+
+        # drop the input samples no future output needs
+        oldest = (self.n_out * self.down + self.delay) // self.up - (self.n_phase_taps - 1)
+        drop = max(0, min(oldest - self.buffer_start, len(self.buffer)))
+        self.buffer = self.buffer[drop:]
+        self.buffer_start += drop
+
+        return output.astype(np.float32)
+
+
+def stream_audio_file(file_path, sample_rate=32000, block_size=4096, read_size=65536):
+    """Decode and resample an audio file block by block.
+
+    Parameters
+    ----------
+    file_path : str
+        The audio file path, any format soundfile can read.
+    sample_rate : int
+        The output sampling frequency.
+    block_size : int
+        The number of samples of the yielded blocks.
+    read_size : int
+        The number of frames decoded at a time.
+
+    Yields
+    ------
+    block : ndarray
+        Mono float32 blocks of block_size samples, the last one can be shorter.
+    """
+    pending = np.zeros(0, dtype=np.float32)
+
+    with sf.SoundFile(file_path) as f:
+        resampler = StreamingResampler(f.samplerate, sample_rate) if f.samplerate != sample_rate else None
+        while True:
+            frames = f.read(read_size, dtype='float32', always_2d=True)
+            final = len(frames) < read_size
+            mono = frames.mean(axis=1)
+            if resampler is not None:
+                mono = resampler.process(mono, final=final)
+
+            pending = np.concatenate([pending, mono])
+            n_full = len(pending) // block_size * block_size
+            for start in range(0, n_full, block_size):
+                yield pending[start:start + block_size]
+            pending = pending[n_full:]
+
+            if final:
+                break
+
+    if len(pending):
+        yield pending
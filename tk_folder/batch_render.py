@@ -0,0 +1,200 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from readaudio import render_audio_with_rir
+
+# Headless batch auralization, no window is opened:
+#   python batch_render.py jobs.json [--workers N] [--summary timings.csv]
+#
+# Job file (JSON, or YAML with PyYAML installed), "defaults" are merged into
+# every job and relative paths are relative to the job file:
+#   {"defaults": {"room_dim": [5, 4, 3], "max_order": 10, "quality": "final"},
+#    "jobs": [{"name": "a", "audio": "in.wav", "output": "out/a.wav",
+#              "mics": {"mic_1": [2, 2, 1.5]}, "sources": {"src_1": [1, 1, 1.5]},
+#              "materials": {"wall": {"description": "wall", "coeffs": [...], "center_freqs": [...]}}}]}
+
+# optional keys of a job, passed as is to render_audio_with_rir
+RENDER_OPTIONS = ('absorption', 'temperature', 'humidity', 'convolution_method', 'block_size', 'mix_down', 'quality', 'fs', 'precision', 'materials')
+REQUIRED_KEYS = ('audio', 'output', 'room_dim', 'max_order', 'mics', 'sources')
+# timing columns, by status message of render_audio_with_rir
+STAGES = {
+    "Reading audio file...": 'read',
+    "Computing room impulse response...": 'rir',
+    "Applying room impulse responses to audio...": 'convolve',
+    # convolution_method 'partitioned': decoded, convolved and written block by block
+    "Streaming audio through the room impulse responses...": 'convolve',
+    "Writing output...": 'write',
+}
+SUMMARY_FIELDS = ('name', 'status', 'read', 'rir', 'convolve', 'write', 'total', 'output', 'error')
+
+
+def load_jobs(job_file: str):
+    """Read a job file.
+
+    Parameters
+    ----------
+    job_file : str
+        The JSON or YAML (.yaml, .yml) job file: a list of jobs, or
+        {"defaults": {...}, "jobs": [...]}.
+
+    Returns
+    -------
+    jobs : list
+        The jobs with the defaults merged in and absolute 'audio' and
+        'output' paths. Jobs without a 'name' are named job_<index>.
+    """
+    with open(job_file) as f:
+        if job_file.endswith(('.yaml', '.yml')):
+            import yaml
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    if isinstance(spec, list):
+        spec = {'jobs': spec}
+    defaults = spec.get('defaults', {})
+    base_dir = os.path.dirname(os.path.abspath(job_file))
+
+    jobs = []
+    for i, job in enumerate(spec['jobs']):
+        job = {**defaults, **job}
+        missing = [key for key in REQUIRED_KEYS if key not in job]
+        if missing:
+            raise ValueError(f"Job {i} has no {', '.join(missing)}")
+        job.setdefault('name', f'job_{i}')
+        for key in ('audio', 'output'):
+            job[key] = os.path.join(base_dir, job[key])
+        # positions as a list: name them like the GUI does
+        for key, prefix in (('mics', 'mic'), ('sources', 'src')):
+            if isinstance(job[key], list):
+                job[key] = {f'{prefix}_{n + 1}': pos for n, pos in enumerate(job[key])}
+        jobs.append(job)
+    return jobs
+
+
+def run_job(job: dict, fft_workers: int = None):
+    """Render one job and write its output.
+
+    Errors are caught, so one bad job doesn't stop the batch.
+
+    Parameters
+    ----------
+    job : dict
+        The job, see load_jobs.
+    fft_workers : int, optional
+        The number of FFTW threads of the convolution, all the CPUs if None.
+
+    Returns
+    -------
+    summary : dict
+        The row of the job in the summary, see SUMMARY_FIELDS: the time of
+        each stage in seconds, status 'ok' or 'error' and the error message.
+    """
+    summary = {'name': job['name'], 'output': job['output'], 'status': 'ok', 'error': ''}
+    start = stage_start = time.perf_counter()
+    stage = None
+
+    def status_callback(status):
+        # a new status message ends the previous stage
+        nonlocal stage, stage_start
+        now = time.perf_counter()
+        if stage is not None:
+            summary[stage] = now - stage_start
+        stage, stage_start = STAGES.get(status, status), now
+
+    try:
+        options = {key: job[key] for key in RENDER_OPTIONS if key in job}
+        os.makedirs(os.path.dirname(job['output']), exist_ok=True)
+        render_audio_with_rir(job['audio'], job['room_dim'], options.pop('absorption', 0.5), job['max_order'], job['mics'], job['sources'],
+                              progress_callback=lambda value: None, status_callback=status_callback, output_path=job['output'], workers=fft_workers, **options)
+        status_callback(None)
+    except Exception as e:
+        summary['status'] = 'error'
+        summary['error'] = f'{type(e).__name__}: {e}'
+
+    summary['total'] = time.perf_counter() - start
+    return summary
+
+
+def run_jobs(jobs: list, n_workers: int = None, progress_callback=None):
+    """Render jobs across a process pool.
+
+    Parameters
+    ----------
+    jobs : list
+        The jobs, see load_jobs.
+    n_workers : int or None
+        The number of worker processes, None for one per CPU, 1 to render
+        in this process. The CPUs are split between the processes for the
+        FFTW threads of the convolution.
+    progress_callback : callable, optional
+        Called with the summary of each job when it is done.
+
+    Returns
+    -------
+    summaries : list
+        The summary of every job, in the order of the jobs.
+    """
+    summaries = [None] * len(jobs)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers == 1:
+        for i, job in enumerate(jobs):
+            summaries[i] = run_job(job)
+            if progress_callback:
+                progress_callback(summaries[i])
+    else:
+        # share the CPUs between the processes, not cpu_count threads each
+        fft_workers = max(1, (os.cpu_count() or 1) // n_workers)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(run_job, job, fft_workers): i for i, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                summaries[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(summaries[futures[future]])
+
+    return summaries
+
+
+def write_summary(summaries: list, path: str):
+    """Write the per job timings as a CSV file, one row per job."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow({key: f'{value:.3f}' if isinstance(value, float) else value for key, value in summary.items()})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the jobs of a job file without the GUI.")
+    parser.add_argument('job_file', help="JSON or YAML job file")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--summary', default=None, help="timing summary CSV (default: <job file>_summary.csv)")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.job_file)
+    summary_path = args.summary or os.path.splitext(args.job_file)[0] + '_summary.csv'
+    done = 0
+
+    def report(summary):
+        nonlocal done
+        done += 1
+        detail = summary['output'] if summary['status'] == 'ok' else summary['error']
+        print(f"[{done}/{len(jobs)}] {summary['name']}: {summary['status']} in {summary['total']:.1f} s, {detail}", flush=True)
+
+    start = time.perf_counter()
+    summaries = run_jobs(jobs, args.workers, progress_callback=report)
+    write_summary(summaries, summary_path)
+
+    failed = sum(summary['status'] != 'ok' for summary in summaries)
+    print(f"{len(jobs) - failed}/{len(jobs)} jobs rendered in {time.perf_counter() - start:.1f} s, summary: {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
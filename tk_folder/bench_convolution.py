@@ -0,0 +1,47 @@
+import timeit
+import numpy as np
+import scipy.fft
+from convolution import fft_convolve, fft_convolve_multi, partitioned_convolve
+
+# Micro-benchmark of the audio/RIR convolutions, run: python bench_convolution.py
+
+fs = 32000
+rir_len = fs # 1 s RIR
+durations = [1, 10, 60, 300] # audio lengths in seconds
+repeats = 3
+
+
+def complex_fft_convolve(audio, rir):
+    # Previous apply_rir_to_audio: complex FFTs at the exact output length
+    size = len(audio) + len(rir) - 1
+    audio_padded = np.pad(audio, (0, size - len(audio)))
+    rir_padded = np.pad(rir, (0, size - len(rir)))
+    result = scipy.fft.ifft(scipy.fft.fft(audio_padded) * scipy.fft.fft(rir_padded))
+    return result.real
+
+
+rng = np.random.default_rng(0)
+rir = rng.standard_normal(rir_len) * np.exp(-np.arange(rir_len) / (0.2 * fs))
+
+print(f"{'audio (s)':>10} {'complex fft':>12} {'real fft':>12} {'speedup':>8} {'partitioned':>12} {'rel. error':>10}")
+for duration in durations:
+    # odd length, the previous version used it as is for the FFT size
+    audio = rng.standard_normal(duration * fs + 1).astype(np.float32)
+
+    reference = complex_fft_convolve(audio, rir)
+    error = np.max(np.abs(fft_convolve(audio, rir) - reference)) / np.max(np.abs(reference))
+
+    t_complex = min(timeit.repeat(lambda: complex_fft_convolve(audio, rir), number=1, repeat=repeats))
+    t_real = min(timeit.repeat(lambda: fft_convolve(audio, rir), number=1, repeat=repeats))
+    t_part = min(timeit.repeat(lambda: partitioned_convolve(audio, rir), number=1, repeat=repeats))
+
+    print(f"{duration:>10} {t_complex:>11.3f}s {t_real:>11.3f}s {t_complex / t_real:>7.1f}x {t_part:>11.3f}s {error:>10.1e}")
+
+# 32-capsule array: one batched convolution against one convolution per channel
+n_channels = 32
+audio = rng.standard_normal(10 * fs).astype(np.float32)
+rirs = rng.standard_normal((n_channels, rir_len)) * np.exp(-np.arange(rir_len) / (0.2 * fs))
+
+t_loop = min(timeit.repeat(lambda: [fft_convolve(audio, rir) for rir in rirs], number=1, repeat=repeats))
+t_multi = min(timeit.repeat(lambda: fft_convolve_multi(audio, rirs), number=1, repeat=repeats))
+print(f"\n{n_channels} channels, 10 s: per channel {t_loop:.3f}s, batched {t_multi:.3f}s ({t_loop / t_multi:.1f}x)")
@@ -0,0 +1,73 @@
+import time
+import numpy as np
+import pyroomacoustics as pra
+from functions_ import QUALITY_PRESETS, ray_budget, ray_tracing_converged
+
+# Benchmark of the ray tracing budget, fixed 100000 rays against
+# ray_budget (with and without early stop, and capped like the draft
+# preset), run: python bench_ray_budget.py (fails with an AssertionError
+# if the draft preset traces as many rays as the final one)
+
+fs = 16000
+absorption = 0.1
+energy_thres = 1e-5
+late_start = 0.05 # late energy starts 50 ms after the emission
+rooms = {
+    'booth (2 m3)': [1.4, 1.2, 1.2],
+    'room (60 m3)': [5, 4, 3],
+    'studio (2400 m3)': [20, 15, 8],
+    'hall (20000 m3)': [40, 25, 20],
+}
+reference_rays = 1000000
+
+
+def ray_trace(room_dim, n_rays, receiver_radius, tol=None):
+    room = pra.ShoeBox(room_dim, fs=fs, materials=pra.Material(absorption), max_order=0)
+    room.add_source(np.array(room_dim) * [0.7, 0.6, 0.5])
+    room.add_microphone(np.array(room_dim) * [0.3, 0.4, 0.5])
+    room.set_ray_tracing(n_rays=n_rays, receiver_radius=receiver_radius, energy_thres=energy_thres)
+
+    start = time.perf_counter()
+    if tol is None:
+        room.ray_tracing()
+        rays = n_rays
+    else:
+        rays = ray_tracing_converged(room, tol=tol)[0]
+    elapsed = time.perf_counter() - start
+
+    hist = np.sum(room.rt_histograms[0][0][0], axis=0)
+    return hist, room.rt_args["hist_bin_size"], rays, elapsed
+
+
+def errors(hist, reference, bin_size):
+    # late energy and Schroeder decay down to -30 dB
+    n_bins = min(len(hist), len(reference))
+    hist, reference = hist[:n_bins], reference[:n_bins]
+    late = int(late_start / bin_size)
+    late_error = abs(hist[late:].sum() - reference[late:].sum()) / reference[late:].sum()
+
+    edc = np.cumsum(hist[::-1])[::-1]
+    edc_ref = np.cumsum(reference[::-1])[::-1]
+    valid = edc_ref > edc_ref[0] * 1e-3
+    edc_error = np.max(np.abs(10 * np.log10(edc[valid] / edc[0]) - 10 * np.log10(edc_ref[valid] / edc_ref[0])))
+    return late_error, edc_error
+
+
+print(f"{'room':>16} {'setting':>12} {'rays':>8} {'radius':>7} {'time':>8} {'late err':>9} {'EDC err':>8}")
+for name, room_dim in rooms.items():
+    budget = ray_budget(room_dim)
+    draft = ray_budget(room_dim, max_rays=QUALITY_PRESETS['draft']['max_rays'])
+    assert draft['n_rays'] < QUALITY_PRESETS['final']['n_rays'], f"{name}: draft traces {draft['n_rays']} rays"
+    reference, bin_size, _, _ = ray_trace(room_dim, reference_rays, budget['receiver_radius'])
+
+    settings = {
+        'fixed': (100000, 0.5, None),
+        'fixed + stop': (100000, 0.5, 0.1),
+        'auto': (budget['n_rays'], budget['receiver_radius'], None),
+        'auto + stop': (budget['n_rays'], budget['receiver_radius'], 0.1),
+        'draft': (draft['n_rays'], draft['receiver_radius'], None),
+    }
+    for setting, (n_rays, radius, tol) in settings.items():
+        hist, bin_size, rays, elapsed = ray_trace(room_dim, n_rays, radius, tol)
+        late_error, edc_error = errors(hist, reference, bin_size)
+        print(f"{name:>16} {setting:>12} {rays:>8} {radius:>6.2f}m {elapsed:>7.2f}s {late_error:>8.1%} {edc_error:>6.2f}dB")
@@ -0,0 +1,35 @@
+import timeit
+import numpy as np
+from convolution import fft_convolve_multi, partitioned_convolve
+from rir_bank import RIRBank
+
+# Regression check of the single precision mode against the double one,
+# run: python check_precision.py (fails with an AssertionError)
+
+fs = 32000
+rir_len = fs # 1 s RIRs
+n_mics = 4
+durations = [10, 60] # audio lengths in seconds
+max_error = 1e-5 # max abs error relative to the peak of the output
+repeats = 3
+
+rng = np.random.default_rng(0)
+decay = np.exp(-np.arange(rir_len) / (0.2 * fs))
+bank = RIRBank.from_lists([[rng.standard_normal(rir_len) * decay for _ in range(2)] for _ in range(n_mics)], fs)
+
+print(f"{'audio (s)':>10} {'method':>12} {'double':>8} {'single':>8} {'speedup':>8} {'memory':>8} {'rel. error':>10}")
+for duration in durations:
+    audio = rng.standard_normal(duration * fs).astype(np.float32)
+
+    for method, convolve in (('fft', fft_convolve_multi), ('partitioned', partitioned_convolve)):
+        results = {dtype: convolve(audio, bank.mixdown(dtype), dtype=dtype) for dtype in (np.float64, np.float32)}
+        reference, single = results[np.float64], results[np.float32]
+        error = np.max(np.abs(single - reference)) / np.max(np.abs(reference))
+        assert single.dtype == np.float32, f"{method}: single precision output is {single.dtype}"
+        assert error < max_error, f"{method}, {duration} s: relative error {error:.1e} over {max_error:.0e}"
+
+        times = {dtype: min(timeit.repeat(lambda: convolve(audio, bank.mixdown(dtype), dtype=dtype), number=1, repeat=repeats)) for dtype in results}
+        print(f"{duration:>10} {method:>12} {times[np.float64]:>7.3f}s {times[np.float32]:>7.3f}s {times[np.float64] / times[np.float32]:>7.1f}x "
+              f"{reference.nbytes / single.nbytes:>7.1f}x {error:>10.1e}")
+
+print("OK")
@@ -0,0 +1,272 @@
+import os
+import numpy as np
+import pyfftw
+import scipy.fft
+
+scipy.fft.set_backend(pyfftw.interfaces.scipy_fft)
+# keep the FFTW plans between calls, repeated sizes skip the planning
+pyfftw.interfaces.cache.enable()
+pyfftw.interfaces.cache.set_keepalive_time(60)
+
+# default number of FFTW threads, read at call time (workers=None) so it
+# can be lowered, e.g. one thread per process in a pool
+FFT_WORKERS = os.cpu_count() or 1
+
+# sample types of the precision settings, the spectra are the matching
+# complex type (complex128 / complex64)
+PRECISIONS = {'double': np.float64, 'single': np.float32}
+
+
+def fft_workers(workers: int = None):
+    """The number of FFTW threads to use, FFT_WORKERS if None."""
+    return FFT_WORKERS if workers is None else workers
+
+
+def precision_dtype(precision: str):
+    """Get the sample type of a precision setting, a key of PRECISIONS."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {list(PRECISIONS)}")
+    return PRECISIONS[precision]
+
+
+def fft_convolve(audio: np.ndarray, rir: np.ndarray, workers: int = None, dtype=np.float64):
+    """Convolve an audio signal with a RIR with real FFTs.
+
+    The transforms are real-to-complex, at the next fast FFT length above
+    len(audio) + len(rir) - 1, and run on ``workers`` FFTW threads.
+
+    Parameters
+    ----------
+    audio : ndarray
+        The audio signal.
+    rir : ndarray
+        The room impulse response.
+    workers : int, optional
+        The number of FFTW threads, FFT_WORKERS if None.
+    dtype : type
+        The sample type of the computation, np.float32 halves the memory
+        of the transforms.
+
+    Returns
+    -------
+    result : ndarray
+        The convolved signal, length len(audio) + len(rir) - 1.
+    """
+    size = len(audio) + len(rir) - 1
+    n_fft = scipy.fft.next_fast_len(size, real=True)
+    workers = fft_workers(workers)
+
+    # rfft zero-pads to n_fft itself
+    audio_fft = scipy.fft.rfft(audio.astype(dtype, copy=False), n=n_fft, workers=workers)
+    rir_fft = scipy.fft.rfft(rir.astype(dtype, copy=False), n=n_fft, workers=workers)
+
+    return scipy.fft.irfft(audio_fft * rir_fft, n=n_fft, workers=workers)[:size]
+
+
+def fft_convolve_multi(audio: np.ndarray, rirs: np.ndarray, workers: int = None, dtype=np.float64):
+    """Convolve an audio signal with several RIRs in one batch.
+
+    The audio is transformed once and its spectrum broadcast over the RIRs,
+    so n RIRs cost one forward audio transform, one batched forward RIR
+    transform and one batched inverse transform.
+
+    Parameters
+    ----------
+    audio : ndarray
+        The audio signal.
+    rirs : ndarray
+        The room impulse responses, shape (n_channels, rir_len), see
+        functions_.stack_rirs.
+    workers : int, optional
+        The number of FFTW threads, FFT_WORKERS if None.
+    dtype : type
+        The sample type of the computation, see fft_convolve.
+
+    Returns
+    -------
+    result : ndarray
+        The convolved signals, shape (n_channels, len(audio) + rir_len - 1).
+    """
+    size = len(audio) + rirs.shape[-1] - 1
+    n_fft = scipy.fft.next_fast_len(size, real=True)
+    workers = fft_workers(workers)
+
+    audio_fft = scipy.fft.rfft(audio.astype(dtype, copy=False), n=n_fft, workers=workers)
+    # float32 RIR banks are transformed in double precision unless asked
+    rirs_fft = scipy.fft.rfft(rirs.astype(dtype, copy=False), n=n_fft, axis=-1, workers=workers)
+
+    return scipy.fft.irfft(rirs_fft * audio_fft, n=n_fft, axis=-1, workers=workers)[:, :size]
+
+
+class PartitionedConvolver:
+    """Uniformly partitioned overlap-save convolution of a stream with a RIR.
+
+    The RIR is cut in blocks of ``block_size`` samples, each transformed once.
+    Every input block is transformed once, pushed in a frequency domain delay
+    line, and gives ``block_size`` output samples, so the memory used only
+    depends on the RIR length and the block size.
+
+    With several RIRs, shape (n_channels, rir_len), the input spectrum is
+    shared by all channels and every output block has shape
+    (n_channels, block_size).
+
+    Parameters
+    ----------
+    rir : ndarray
+        The room impulse response, or the stacked RIRs of several channels.
+    block_size : int
+        The number of samples per block (input and output).
+    dtype : type
+        The sample type of the computation, see fft_convolve.
+    workers : int, optional
+        The number of FFTW threads, the backend default (one thread) if
+        None: the block transforms are too small to gain from more.
+    """
+
+    def __init__(self, rir: np.ndarray, block_size: int = 4096, dtype=np.float64, workers: int = None):
+        self.block_size = block_size
+        self.workers = workers
+        self.multichannel = rir.ndim == 2
+        rirs = np.atleast_2d(rir)
+        n_parts = max(1, int(np.ceil(rirs.shape[-1] / block_size)))
+
+        # transform of each RIR partition, zero-padded to 2 blocks
+        padded = np.zeros((len(rirs), n_parts * block_size), dtype=dtype)
+        padded[:, :rirs.shape[-1]] = rirs
+        parts = np.zeros((len(rirs), n_parts, 2 * block_size), dtype=dtype)
+        parts[:, :, :block_size] = padded.reshape(len(rirs), n_parts, block_size)
+        self.rir_parts = scipy.fft.rfft(parts, axis=-1, workers=self.workers)
+
+        # frequency domain delay line of the last n_parts input blocks
+        self.delay_line = np.zeros(self.rir_parts.shape[1:], dtype=self.rir_parts.dtype)
+        self.position = 0
+        self.input_buffer = np.zeros(2 * block_size, dtype=dtype)
+
+    def process(self, block: np.ndarray):
+        """Convolve the next input block.
+
+        Parameters
+        ----------
+        block : ndarray
+            The next input samples, at most ``block_size``, shorter blocks
+            are zero-padded.
+
+        Returns
+        -------
+        output : ndarray
+            The next ``block_size`` output samples, shape
+            (n_channels, block_size) with several RIRs.
+        """
+        n = self.block_size
+        self.input_buffer[:n] = self.input_buffer[n:]
+        self.input_buffer[n:n + len(block)] = block
+        self.input_buffer[n + len(block):] = 0
+
+        self.delay_line[self.position] = scipy.fft.rfft(self.input_buffer, workers=self.workers)
+        # the newest block goes with the first partition, the oldest with the last
+        order = (self.position - np.arange(len(self.delay_line))) % len(self.delay_line)
+        spectrum = np.sum(self.delay_line[order] * self.rir_parts, axis=1)
+        self.position = (self.position + 1) % len(self.delay_line)
+
+        # the first half is circular aliasing, the second half is valid
+        output = scipy.fft.irfft(spectrum, n=2 * n, axis=-1, workers=self.workers)[:, n:]
+        return output if self.multichannel else output[0]
+
+
+def partitioned_convolve(audio: np.ndarray, rir: np.ndarray, block_size: int = 4096, dtype=np.float64, workers: int = None):
+    """Convolve an audio signal with a RIR block by block.
+
+    Same result as ``readaudio.apply_rir_to_audio`` without the full size
+    transforms.
+
+    Parameters
+    ----------
+    audio : ndarray
+        The audio signal.
+    rir : ndarray
+        The room impulse response, or the stacked RIRs of several channels,
+        shape (n_channels, rir_len).
+    block_size : int
+        The number of samples per block.
+    dtype : type
+        The sample type of the computation and of the result.
+    workers : int, optional
+        The number of FFTW threads, see PartitionedConvolver.
+
+    Returns
+    -------
+    result : ndarray
+        The convolved signal, length len(audio) + rir_len - 1 (last axis).
+    """
+    size = len(audio) + rir.shape[-1] - 1
+    result = np.zeros(rir.shape[:-1] + (size,), dtype=dtype)
+    convolver = PartitionedConvolver(rir, block_size, dtype, workers)
+
+    # keep feeding (zero) blocks until the tail of the RIR is out
+    for start in range(0, size, block_size):
+        output = convolver.process(audio[start:start + block_size])
+        result[..., start:start + block_size] = output[..., :size - start]
+
+    return result
+
+
+def _reblock(blocks, block_size: int):
+    # cut and merge the input into blocks of block_size samples, the last
+    # one can be shorter
+    pending = np.zeros(0)
+    for block in blocks:
+        pending = np.concatenate([pending, block]) if len(pending) else np.asarray(block)
+        n_full = len(pending) // block_size * block_size
+        for start in range(0, n_full, block_size):
+            yield pending[start:start + block_size]
+        pending = pending[n_full:]
+    if len(pending):
+        yield pending
+
+
+def stream_convolve(blocks, rir: np.ndarray, block_size: int = 4096, dtype=np.float64, workers: int = None):
+    """Convolve a stream of audio blocks with a RIR as they come in.
+
+    Pairs with audio_stream.stream_audio_file, so decoding, convolution and
+    output run block by block.
+
+    Parameters
+    ----------
+    blocks : iterable
+        The input blocks, of any length: they are cut or merged into blocks
+        of block_size samples before the convolution.
+    rir : ndarray
+        The room impulse response, or the stacked RIRs of several channels,
+        shape (n_channels, rir_len).
+    block_size : int
+        The number of samples per block.
+    dtype : type
+        The sample type of the computation and of the output blocks.
+    workers : int, optional
+        The number of FFTW threads, see PartitionedConvolver.
+
+    Yields
+    ------
+    block : ndarray
+        The output blocks, then the blocks of the RIR tail. The last one is
+        cut at len(audio) + rir_len - 1 samples in total.
+    """
+    convolver = PartitionedConvolver(rir, block_size, dtype, workers)
+    n_in = 0
+    n_out = 0
+    output = None
+    for block in _reblock(blocks, block_size):
+        # hold each output back one block, the last one may need cutting
+        if output is not None:
+            yield output
+            n_out += output.shape[-1]
+        n_in += len(block)
+        output = convolver.process(block)
+
+    size = n_in + rir.shape[-1] - 1
+    while n_out < size:
+        if output is None:
+            output = convolver.process(np.zeros(0))
+        yield output[..., :size - n_out]
+        n_out += output.shape[-1]
+        output = None
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import scipy.fft
+from scipy.signal import stft
+from functions_ import stack_rirs
+
+# last computed responses and spectrograms, keyed by (RIR bank digest, fs,
+# settings), so repeated plot clicks and panel updates reuse them
+RESPONSE_CACHE_SIZE = 8
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def frequency_responses(rirs, fs, n_fft=None, normalize=True):
+    """Frequency responses of a bank of RIRs, in one batched real FFT.
+
+    Parameters
+    ----------
+    rirs : list or ndarray
+        The room impulse responses, a list of 1-D arrays or a (n_rirs, L)
+        array.
+    fs : int
+        The sampling frequency.
+    n_fft : int, optional
+        The FFT length, the responses have n_fft // 2 + 1 points from 0 to
+        fs / 2. Default: the RIR length (full resolution). Shorter lengths
+        fold the RIRs in time first, so the points are exact samples of
+        their spectrum, like scipy.signal.freqz.
+    normalize : bool
+        If True, normalize every RIR by its peak first.
+
+    Returns
+    -------
+    freq : ndarray
+        The frequencies in Hz.
+    responses : ndarray
+        The complex responses, shape (n_rirs, n_fft // 2 + 1).
+    """
+    bank = rirs if isinstance(rirs, np.ndarray) else stack_rirs(rirs)
+    if n_fft is None:
+        n_fft = scipy.fft.next_fast_len(bank.shape[-1], real=True)
+
+    key = (hashlib.blake2b(np.ascontiguousarray(bank).view(np.uint8), digest_size=16).hexdigest(), bank.shape, fs, n_fft, normalize)
+    with _response_cache_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+
+    if normalize:
+        peak = np.max(np.abs(bank), axis=-1, keepdims=True)
+        bank = bank / np.where(peak > 0, peak, 1)
+
+    if bank.shape[-1] > n_fft:
+        # sampling the spectrum at n_fft points aliases the RIR modulo n_fft
+        n_blocks = -(-bank.shape[-1] // n_fft)
+        padded = np.zeros((len(bank), n_blocks * n_fft))
+        padded[:, :bank.shape[-1]] = bank
+        bank = padded.reshape(len(bank), n_blocks, n_fft).sum(axis=1)
+
+    freq = np.arange(n_fft // 2 + 1) * fs / n_fft
+    responses = scipy.fft.rfft(bank, n=n_fft, axis=-1)
+    # the cached arrays are shared between callers
+    freq.flags.writeable = False
+    responses.flags.writeable = False
+
+    with _response_cache_lock:
+        _response_cache[key] = (freq, responses)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return freq, responses
+
+
+def spectrograms(rirs, fs, nperseg=256, noverlap=None, floor_db=-200):
+    """Spectrograms of a bank of RIRs, in one batched STFT, in dB.
+
+    Parameters
+    ----------
+    rirs : list or ndarray
+        The room impulse responses, a list of 1-D arrays or a (n_rirs, L)
+        array.
+    fs : int
+        The sampling frequency.
+    nperseg : int
+        The length of each segment.
+    noverlap : int, optional
+        The number of points to overlap between segments, nperseg // 2 if
+        None.
+    floor_db : float
+        The magnitude floor, the zero padding of the RIRs is at this level
+        instead of -inf.
+
+    Returns
+    -------
+    f : ndarray
+        The frequencies in Hz.
+    t : ndarray
+        The segment times in s.
+    magnitude_db : ndarray
+        The magnitudes in dB, float32, shape (n_rirs, len(f), len(t)).
+    """
+    bank = rirs if isinstance(rirs, np.ndarray) else stack_rirs(rirs)
+    if noverlap is None:
+        noverlap = nperseg // 2
+
+    key = ('stft', hashlib.blake2b(np.ascontiguousarray(bank).view(np.uint8), digest_size=16).hexdigest(), bank.shape, fs, nperseg, noverlap, floor_db)
+    with _response_cache_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+
+    # every RIR along the last axis at once
+    f, t, spectra = stft(bank, fs, nperseg=nperseg, noverlap=noverlap, axis=-1)
+    magnitude_db = (20 * np.log10(np.maximum(np.abs(spectra), 10 ** (floor_db / 20)))).astype(np.float32)
+    for array in (f, t, magnitude_db):
+        array.flags.writeable = False
+
+    with _response_cache_lock:
+        _response_cache[key] = (f, t, magnitude_db)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return f, t, magnitude_db
@@ -1,10 +1,11 @@
 import numpy as np
-import scipy.signal as signal
 import pyroomacoustics as pra
 import matplotlib.pyplot as plt
+from rir_cache import default_cache, scene_hash
+from rir_bank import room_bank
 
 
-def freq_resp(room: pra.ShoeBox, norm_ir):
+def freq_resp(room: pra.ShoeBox, norm_ir, n_fft: int = None):
     """Compute the frequency response of the room impulse response.\n
     **NOT OFFICIAL pyroomacoustics function**
 
@@ -14,6 +15,8 @@ def freq_resp(room: pra.ShoeBox, norm_ir):
         The room object.
     norm_ir : ndarray
         The normalized and combined room impulse response.
+    n_fft : int, optional
+        The FFT length, see freq_response.frequency_responses.
 
     Returns
     -------
@@ -22,13 +25,162 @@ def freq_resp(room: pra.ShoeBox, norm_ir):
         format : (freq, response)
             
     """
+    # imported here, freq_response imports this module
+    from freq_response import frequency_responses
 
-    freq, response = signal.freqz(norm_ir, fs=room.fs)
-    freq_response = (freq, response)
+    freq, responses = frequency_responses([norm_ir], room.fs, n_fft=n_fft, normalize=False)
+    freq_response = (freq, responses[0])
     return freq_response
 
 
-def compute_rir(room_dim, absorption, max_order: int, mic_positions: dict, src_positions: dict, audio_signal: np.ndarray, temperature: float, humidity: float):
+# Simulation settings of the quality presets, "draft" for quick previews
+# while editing the scene, "final" for the export, "preview" for the image
+# source only RIRs shown while the final ones are computed (its order is
+# also capped by the order of the preset it previews). max_fs and
+# max_order cap the user's values (None: no cap), n_rays=0 disables the
+# ray tracing and 'auto' sizes it from the room (see ray_budget), up to
+# max_rays (None: ray_budget's own cap). Draft stays well under the final
+# budget even in large halls.
+QUALITY_PRESETS = {
+    'preview': {'max_fs': None, 'max_order': 3, 'n_rays': 0, 'max_rays': None},
+    'draft': {'max_fs': 16000, 'max_order': 2, 'n_rays': 'auto', 'max_rays': 10000},
+    'final': {'max_fs': None, 'max_order': None, 'n_rays': 100000, 'max_rays': None},
+}
+
+
+def quality_settings(quality: str, max_order: int, fs: int = 32000):
+    """Get the simulation settings of a quality preset.\n
+    **NOT OFFICIAL pyroomacoustics function**
+
+    Parameters
+    ----------
+    quality : str
+        The preset name, a key of QUALITY_PRESETS.
+    max_order : int
+        The maximum reflection order asked by the user.
+    fs : int
+        The sampling frequency asked by the user.
+
+    Returns
+    -------
+    settings : dict
+        The compute_rir settings.
+        format: {"fs": fs, "max_order": max_order, "n_rays": n_rays, "max_rays": max_rays}
+    """
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Unknown quality '{quality}', expected one of {list(QUALITY_PRESETS)}")
+    preset = QUALITY_PRESETS[quality]
+    return {
+        'fs': fs if preset['max_fs'] is None else min(fs, preset['max_fs']),
+        'max_order': max_order if preset['max_order'] is None else min(max_order, preset['max_order']),
+        'n_rays': preset['n_rays'],
+        'max_rays': preset['max_rays'],
+    }
+
+
+def ray_budget(room_dim, target_std: float = 0.1, hist_bin_size: float = 0.004, c: float = 343.0, min_rays: int = 1000, max_rays: int = 300000):
+    """Choose the number of rays and the receiver radius from the room size.\n
+    **NOT OFFICIAL pyroomacoustics function**
+
+    A ray crosses a receiver sphere of radius r about pi * r**2 * c * dt / V
+    times per histogram bin of length dt (Vorlaender 2008, Eq. 11.12), the
+    relative standard deviation of the energy of a bin is then about
+    1 / sqrt(n_rays * pi * r**2 * c * dt / V). The radius follows the mean
+    free path 4V/S, so the receiver stays small compared to the distance
+    between two reflections.
+
+    Parameters
+    ----------
+    room_dim : list
+        The dimensions of the room.
+    target_std : float
+        The target relative standard deviation of the late energy of a
+        histogram bin.
+    hist_bin_size : float
+        The length of the ray tracing histogram bins in seconds.
+    c : float
+        The speed of sound.
+    min_rays, max_rays : int
+        The bounds of the number of rays.
+
+    Returns
+    -------
+    budget : dict
+        format: {"n_rays": n_rays, "receiver_radius": receiver_radius}
+    """
+    volume = np.prod(room_dim)
+    surface = 2 * (room_dim[0] * room_dim[1] + room_dim[1] * room_dim[2] + room_dim[0] * room_dim[2])
+    mean_free_path = 4 * volume / surface
+
+    receiver_radius = float(np.clip(mean_free_path / 4, 0.1, 1.0))
+    n_rays = volume / (target_std ** 2 * np.pi * receiver_radius ** 2 * c * hist_bin_size)
+    return {'n_rays': int(np.clip(n_rays, min_rays, max_rays)), 'receiver_radius': receiver_radius}
+
+
+def ray_tracing_converged(room: pra.ShoeBox, n_batches: int = 10, tol: float = 0.1, seed: int = 0):
+    """Run the ray tracing of the room in batches, stop once the energy converges.\n
+    **NOT OFFICIAL pyroomacoustics function**
+
+    The rays set by room.set_ray_tracing are shot in n_batches batches per
+    source, in random directions (the default directions of pyroomacoustics
+    are the same for every batch). The histograms of the batches are averaged, and the source stops
+    when one batch changes their energy decay curve (Schroeder integral,
+    down to -30 dB) by less than tol dB, after at least 3 batches. Call
+    room.compute_rir() afterwards, it uses the averaged histograms.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.ShoeBox
+        The room, with the sources, microphones and ray tracing set.
+    n_batches : int
+        The maximum number of batches per source.
+    tol : float
+        The change of the energy decay curve in dB under which the batches
+        stop.
+    seed : int
+        The seed of the ray directions, for reproducible RIRs.
+
+    Returns
+    -------
+    n_rays : list
+        The number of rays shot for each source.
+    """
+    batch_size = -(-room.rt_args["n_rays"] // n_batches)
+    engine = room.room_engine
+    n_mics = room.mic_array.M
+    rng = np.random.default_rng(seed)
+
+    room.rt_histograms = [[] for _ in range(n_mics)]
+    n_rays = []
+    for src in room.sources:
+        engine.reset_mics()
+        edc = None
+        for n_done in range(1, n_batches + 1):
+            # the histograms add up, each batch is normalized by its own size
+            azimuth = rng.uniform(0, 2 * np.pi, batch_size)
+            colatitude = np.arccos(1 - 2 * rng.uniform(size=batch_size))
+            engine.ray_tracing(np.array([azimuth, colatitude], dtype=np.float32), src.position)
+            hist = np.sum([h.get_hist().sum(axis=0) for mic in engine.microphones for h in mic.histograms], axis=0)
+            previous, edc = edc, np.cumsum(hist[::-1])[::-1]
+            if n_done >= 3:
+                # same normalization for both curves, the 1 / n_done cancels,
+                # the histograms grow when a ray travels further
+                n_bins = min(len(edc), len(previous))
+                valid = (edc[:n_bins] > edc[0] * 1e-3) & (previous[:n_bins] > 0)
+                change = 10 * np.log10(edc[:n_bins][valid] / edc[0]) - 10 * np.log10(previous[:n_bins][valid] / previous[0])
+                if np.max(np.abs(change)) <= tol:
+                    break
+
+        for r in range(n_mics):
+            room.rt_histograms[r].append([h.get_hist() / n_done for h in engine.microphones[r].histograms])
+        n_rays.append(n_done * batch_size)
+    engine.reset_mics()
+
+    room.simulator_state["rt_done"] = True
+    return n_rays
+
+
+def compute_rir(room_dim, absorption, max_order: int, mic_positions: dict, src_positions: dict, audio_signal: np.ndarray = None, temperature: float = None, humidity: float = None, simulate: bool = False, use_cache: bool = True, fs: int = 32000, n_rays=100000, rt_tol: float = None, materials: dict = None, max_rays: int = None):
     """Compute the room impulse response of the room.\n
     **NOT OFFICIAL pyroomacoustics function**
 
@@ -46,18 +198,41 @@ def compute_rir(room_dim, absorption, max_order: int, mic_positions: dict, src_p
     src_positions : dict
         The source positions.
         format: {"src_1": [x1, y1, z1], "src_2": [x2, y2, z2], ...}
-    audio_signal : ndarray
+    audio_signal : ndarray, optional
         The audio signal to be used as the source signal.
+        Only needed with simulate=True.
     temperature : float
         The temperature of the room.
     humidity : float
         The humidity of the room.
+    simulate : bool
+        If True, also run room.simulate() with the audio signal on every
+        source, the mixed signals are then in room.mic_array.signals.
+        Default False: only the RIRs are computed.
+    use_cache : bool
+        If True, reuse the RIRs of an identical scene from the on-disk
+        cache (rir_cache.default_cache) instead of simulating again.
+    fs : int
+        The sampling frequency of the RIRs.
+    n_rays : int or str
+        The number of rays of the ray tracing, 0 for image sources only,
+        'auto' to size it and the receiver from the room (ray_budget).
+    max_rays : int, optional
+        The cap of the 'auto' number of rays, ray_budget's default if None.
+    rt_tol : float, optional
+        If set, shoot the rays in batches and stop once the energy changes
+        by less than rt_tol (ray_tracing_converged).
+    materials : dict, optional
+        Materials replacing the default ones, by surface ('floor',
+        'ceiling' and 'wall' for the four walls).
+        format: {"floor": {"description": ..., "coeffs": [...], "center_freqs": [...]}, ...}
 
     Returns
     -------
     room : pyroomacoustics.Room
         The room object and its properties.
-        Access the room impulse response: room.rir[mic_idx][src_idx]
+        Access the room impulse response: room.rir[mic_idx][src_idx],
+        or all of them padded in one float32 array: room.rir_bank
     
     """
     ceiling_mat = {
@@ -75,24 +250,90 @@ def compute_rir(room_dim, absorption, max_order: int, mic_positions: dict, src_p
         'coeffs': [0.1, 0.2, 0.1, 0.1, 0.1, 0.05],
         'center_freqs': [125, 250, 500, 1000, 2000, 4000]
     }
+    if materials:
+        unknown = set(materials) - {'floor', 'ceiling', 'wall'}
+        if unknown:
+            raise ValueError(f"Unknown surfaces {sorted(unknown)}, expected 'floor', 'ceiling' or 'wall'")
+        floor_mat = materials.get('floor', floor_mat)
+        ceiling_mat = materials.get('ceiling', ceiling_mat)
+        wall_mat = materials.get('wall', wall_mat)
+    max_rand_disp = 0.01
+    energy_thres = 1e-5
+    ray_tracing = n_rays == 'auto' or n_rays > 0
+    receiver_radius = 0.5
+
     material = pra.make_materials(floor=floor_mat, ceiling=ceiling_mat, west=wall_mat, east=wall_mat, north=wall_mat, south=wall_mat)
-    room = pra.ShoeBox(room_dim, fs=32000, materials=material, 
-                       max_order=max_order, ray_tracing=True, use_rand_ism=True, 
-                       max_rand_disp=0.01, air_absorption=True, temperature=temperature, humidity=humidity)
-    #room = pra.ShoeBox(room_dim, fs=32000, materials=pra.Material(absorption), max_order=max_order, ray_tracing=True, use_rand_ism=True, max_rand_disp=0.01, air_absorption=True, temperature=temperature, humidity=humidity)    
+    room = pra.ShoeBox(room_dim, fs=fs, materials=material, 
+                       max_order=max_order, ray_tracing=ray_tracing, use_rand_ism=True, 
+                       max_rand_disp=max_rand_disp, air_absorption=True, temperature=temperature, humidity=humidity)
+    #room = pra.ShoeBox(room_dim, fs=32000, materials=pra.Material(absorption), max_order=max_order, ray_tracing=ray_tracing, use_rand_ism=True, max_rand_disp=0.01, air_absorption=True, temperature=temperature, humidity=humidity)    
     for src_pos in src_positions.values():
-        room.add_source(src_pos, signal=audio_signal)
+        room.add_source(src_pos)
 
     for mic_pos in mic_positions.values():
         room.add_microphone_array(pra.MicrophoneArray(np.array([mic_pos]).T, room.fs))
 
-    room.set_ray_tracing(n_rays=100000, energy_thres=1e-5)
-    room.compute_rir()
-    room.simulate()
+    if ray_tracing:
+        if n_rays == 'auto':
+            budget = ray_budget(room_dim, c=room.c) if max_rays is None else ray_budget(room_dim, c=room.c, max_rays=max_rays)
+            n_rays, receiver_radius = budget['n_rays'], budget['receiver_radius']
+        room.set_ray_tracing(n_rays=n_rays, receiver_radius=receiver_radius, energy_thres=energy_thres)
+
+    # everything the RIRs depend on
+    scene = {
+        'room_dim': room_dim, 'max_order': max_order, 'fs': fs,
+        'materials': [floor_mat, ceiling_mat, wall_mat],
+        'mic_positions': list(mic_positions.values()), 'src_positions': list(src_positions.values()),
+        'temperature': temperature, 'humidity': humidity, 'air_absorption': True,
+        'use_rand_ism': True, 'max_rand_disp': max_rand_disp,
+        'ray_tracing': {'n_rays': n_rays, 'receiver_radius': receiver_radius, 'energy_thres': energy_thres, 'tol': rt_tol} if ray_tracing else None,
+        'pyroomacoustics': pra.__version__,
+    }
+    key = scene_hash(scene)
+    cached_rir = default_cache.get(key) if use_cache else None
+
+    if cached_rir is not None:
+        room.rir = cached_rir
+    else:
+        if ray_tracing and rt_tol is not None:
+            ray_tracing_converged(room, tol=rt_tol)
+        room.compute_rir()
+        if use_cache:
+            default_cache.put(key, room.rir)
+    room_bank(room)
+
+    if simulate:
+        simulate_room(room, audio_signal)
 
     return room
 
 
+def simulate_room(room: pra.ShoeBox, audio_signal: np.ndarray):
+    """Play the audio signal on every source and simulate the microphone signals.\n
+    **NOT OFFICIAL pyroomacoustics function**
+
+    Only needed for pyroomacoustics' mixed signals, the RIRs alone are
+    enough to auralize with readaudio.process_audio_with_rir.
+
+    Parameters
+    ----------
+    room : pyroomacoustics.Room
+        The room object returned by compute_rir.
+    audio_signal : ndarray
+        The audio signal to be used as the source signal.
+
+    Returns
+    -------
+    signals : ndarray
+        The simulated microphone signals, room.mic_array.signals.
+    """
+    for source in room.sources:
+        source.add_signal(audio_signal)
+
+    room.simulate()
+    return room.mic_array.signals
+
+
 def calculate_responses(room: pra.ShoeBox, mic_positions: dict, src_positions: dict):
     """Calculate the room impulse response and the frequency response.\n
     **NOT OFFICIAL pyroomacoustics function**
@@ -121,6 +362,26 @@ def calculate_responses(room: pra.ShoeBox, mic_positions: dict, src_positions: d
         rir_responses[f"mic_{mic_idx + 1}"] = [room.rir[mic_idx][src_idx] for src_idx in range(len(src_positions))]
     return rir_responses
 
+def stack_rirs(rirs: list):
+    """Stack room impulse responses of different lengths in one array.\n
+    **NOT OFFICIAL pyroomacoustics function**
+
+    Parameters
+    ----------
+    rirs : list
+        The list of room impulse responses.
+        format: [rir_1, rir_2, ...]
+
+    Returns
+    -------
+    rir_stack : ndarray
+        The zero-padded RIRs, shape (len(rirs), longest RIR length).
+    """
+    rir_stack = np.zeros((len(rirs), max(len(rir) for rir in rirs)))
+    for i, rir in enumerate(rirs):
+        rir_stack[i, :len(rir)] = rir
+    return rir_stack
+
 def plot_freq_response(freq_responses: dict, mic_positions: dict):
     """Plot the frequency response of the room impulse response.\n
     **NOT OFFICIAL pyroomacoustics function**
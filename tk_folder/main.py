@@ -1,8 +1,12 @@
+import queue
+import threading
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import filedialog
-import sounddevice as sd
-from readaudio import process_audio_with_rir, read_audio_file
+from playback import AudioPlayer
+from readaudio import render_audio_with_rir, plot_signals, read_audio_file, preload_audio_file, PipelineCancelled
+from functions_ import quality_settings
+from plotting_fcts import plotting_buttons_window
 import soundfile as sf
 from tkinter import messagebox
 
@@ -20,6 +24,13 @@ class SharedData:
         self.file_path = tk.StringVar(name="file_path", value="")
         self.audio_data = tk.StringVar(name="audio_data", value="")
         self.fs = tk.IntVar(name="fs", value=32000)
+        self.quality = tk.StringVar(name="quality", value="final")
+        self.progressive = tk.BooleanVar(name="progressive", value=True)
+        self.single_precision = tk.BooleanVar(name="single_precision", value=False)
+        self.processed_audio = None
+        self.processed_fs = None
+        # one player for the whole app, starting a playback stops the previous one
+        self.player = AudioPlayer()
 
 
 class BaseParameters(ttk.Frame):
@@ -32,11 +43,13 @@ class BaseParameters(ttk.Frame):
         self.room_dim_data = shared_data.room_dimensions
         self.humidity_data = shared_data.humidity
         self.temperature_data = shared_data.temperature
+        self.fs_data = shared_data.fs
         self.create_scale("Absorption", self.abs_data, 0)
         self.create_widgets("Max reflection order", self.max_ref_data, 1)
         self.create_widgets("Humidity", self.humidity_data, 2)
         self.create_widgets("Temperature", self.temperature_data, 3)
         self.create_room_dim_widget("Room dimensions", self.room_dim_data, 4)
+        self.create_widgets("Sample rate", self.fs_data, 5)
         self.create_room_visualization()
 
     def create_scale(self, text, variable, row):
@@ -263,26 +276,71 @@ class FileFrame(ttk.Frame):
         self.file_btn.grid(column=1, row=0, sticky=tk.W, padx=5, pady=5)
         self.play_btn = ttk.Button(self, text="Play", command=self.play_audio)
         self.play_btn.grid(column=2, row=0, sticky=tk.W, padx=5, pady=5)
+        self.stop_btn = ttk.Button(self, text="Stop", command=self.shared_data.player.stop)
+        self.stop_btn.grid(column=3, row=0, sticky=tk.W, padx=5, pady=5)
+        # Play decodes on this thread (the file may still be preloading)
+        self.loader = None
+        self.loaded = queue.Queue()
+        # the draft preset decodes at a lower rate, preload that one
+        self.shared_data.quality.trace_add("write", self.preload)
+
+    def pipeline_fs(self):
+        # the sample rate Calculate decodes the file at (capped by the preset)
+        return quality_settings(self.shared_data.quality.get(), 0, self.shared_data.fs.get())['fs']
+
+    def preload(self, *args):
+        # decode in the background, Play and Calculate get it from the cache
+        if self.file_path.get() != "No file selected":
+            preload_audio_file(self.file_path.get(), sample_rate=self.pipeline_fs())
 
     def select_file(self):
-        self.file_path.set(filedialog.askopenfilename())
+        file_path = filedialog.askopenfilename()
+        if not file_path:
+            return
+        self.file_path.set(file_path)
         self.shared_data.file_path.set(self.file_path.get())
-        audio_data = read_audio_file(self.file_path.get())
-        self.shared_data.audio_data = audio_data
-        self.shared_data.fs = 32000
+        self.preload()
 
     def play_audio(self):
-        if self.file_path.get() != "No file selected":
+        if self.file_path.get() == "No file selected":
+            messagebox.showerror("Error", "No file selected")
+            return
+        if self.loader is not None and self.loader.is_alive():
+            print('Still decoding...')
+            return
+
+        fs = self.pipeline_fs()
+        file_path = self.file_path.get()
+
+        def load():
+            # worker thread: waits for the preload if it is still running,
+            # returns at once if the file is cached
             try:
-                print('Playing audio...')
-                audio_data = (self.shared_data.audio_data)
-                sd.play(audio_data, self.shared_data.fs)
-                sd.wait()
-                print('Audio played!')
+                self.loaded.put(('done', read_audio_file(file_path, sample_rate=fs)))
             except Exception as e:
-                print(e)
-        else:
-            messagebox.showerror("Error", "No file selected")
+                self.loaded.put(('error', e))
+
+        print('Decoding audio...')
+        self.loader = threading.Thread(target=load, daemon=True)
+        self.loader.start()
+        self.after(50, self.poll_loader, fs)
+
+    def poll_loader(self, fs):
+        try:
+            kind, value = self.loaded.get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_loader, fs)
+            return
+
+        if kind == 'error':
+            print(value)
+            return
+        try:
+            print('Playing audio...')
+            self.shared_data.audio_data = value
+            self.shared_data.player.play(value, fs)
+        except Exception as e:
+            print(e)
 
 
 class CalculationsParameters(ttk.Frame):
@@ -304,6 +362,34 @@ class CalculationsParameters(ttk.Frame):
         self.play_btn = ttk.Button(self, text="Play", command=self.play_audio, width=30)
         self.play_btn.grid(column=0, row=4, sticky=tk.N, padx=5, pady=5)
 
+        self.cancel_btn = ttk.Button(self, text="Cancel", command=self.cancel_processing, width=30, state=tk.DISABLED)
+        self.cancel_btn.grid(column=0, row=5, sticky=tk.N, padx=5, pady=5)
+
+        self.stop_btn = ttk.Button(self, text="Stop", command=self.stop_audio, width=30)
+        self.stop_btn.grid(column=0, row=6, sticky=tk.N, padx=5, pady=5)
+
+        self.seek_var = tk.DoubleVar(value=0)
+        self.seek_scale = ttk.Scale(self, from_=0, to=1, variable=self.seek_var, orient=tk.HORIZONTAL, length=300, command=self.seek_audio)
+        self.seek_scale.grid(column=0, row=7, padx=5, pady=5)
+
+        self.export_btn = ttk.Button(self, text="Export WAV", command=self.export_audio, width=30)
+        self.export_btn.grid(column=0, row=8, sticky=tk.N, padx=5, pady=5)
+
+        self.quality_frame = ttk.Frame(self)
+        self.quality_frame.grid(column=0, row=9, sticky=tk.N, padx=5, pady=5)
+        ttk.Label(self.quality_frame, text="Quality").grid(column=0, row=0, sticky=tk.W, padx=5)
+        for i, quality in enumerate(("draft", "final")):
+            ttk.Radiobutton(self.quality_frame, text=quality.capitalize(), value=quality, variable=self.shared_data.quality).grid(column=i + 1, row=0, sticky=tk.W)
+        ttk.Checkbutton(self.quality_frame, text="Preview first", variable=self.shared_data.progressive).grid(column=3, row=0, sticky=tk.W, padx=5)
+        ttk.Checkbutton(self.quality_frame, text="Single precision", variable=self.shared_data.single_precision).grid(column=4, row=0, sticky=tk.W, padx=5)
+
+        # background job: the worker thread only talks to the GUI through the queue
+        self.worker = None
+        self.cancel_event = threading.Event()
+        self.messages = queue.Queue()
+        # windows of the last result, closed when a newer one is shown
+        self.result_windows = []
+
     
     def get_vars(self):
         print('reading vars...')
@@ -321,36 +407,154 @@ class CalculationsParameters(ttk.Frame):
         self.file_path = self.shared_data.file_path.get()
         self.temperature = self.shared_data.temperature.get()
         self.humidity = self.shared_data.humidity.get()
+        self.fs = self.shared_data.fs.get()
+        self.quality = self.shared_data.quality.get()
+        self.progressive = self.shared_data.progressive.get()
+        self.precision = 'single' if self.shared_data.single_precision.get() else 'double'
         print('Retreived vars!')
 
     def update_progress(self, value):
         self.progress['value'] = value
-        self.update_idletasks()
 
     def update_status(self, status):
         self.status_text.set(status)
 
     def process_audio(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
         print('processing audio...')
+        self.cancel_event.clear()
+        self.calculate_btn.configure(state=tk.DISABLED)
+        self.cancel_btn.configure(state=tk.NORMAL)
+
+        self.worker = threading.Thread(target=self.run_pipeline, daemon=True)
+        self.worker.start()
+        self.after(100, self.poll_messages)
+
+    def run_pipeline(self):
+        # worker thread: no Tk calls here, everything goes through the queue
         try:
-            processed_audio, sample_rate = process_audio_with_rir(self.file_path, self.room_dim, self.abs, self.max_reflection_order, self.mic_data, self.src_data, progress_callback=self.update_progress, status_callback=self.update_status, temperature=self.temperature, humidity=self.humidity)
-            sf.write('processed.wav', processed_audio, sample_rate)
+            result = render_audio_with_rir(self.file_path, self.room_dim, self.abs, self.max_reflection_order, self.mic_data, self.src_data,
+                                           progress_callback=lambda value: self.messages.put(('progress', value)),
+                                           status_callback=lambda status: self.messages.put(('status', status)),
+                                           temperature=self.temperature, humidity=self.humidity, cancel_event=self.cancel_event,
+                                           quality=self.quality, fs=self.fs, precision=self.precision,
+                                           preview_callback=(lambda result: self.messages.put(('preview', result))) if self.progressive else None)
+            self.messages.put(('done', result))
+        except PipelineCancelled:
+            self.messages.put(('cancelled', None))
+        except Exception as e:
+            self.messages.put(('error', e))
+
+    def poll_messages(self):
+        while True:
+            try:
+                kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'progress':
+                self.update_progress(value)
+            elif kind == 'status':
+                self.update_status(value)
+            elif kind == 'preview':
+                try:
+                    self.show_result(value, preview=True)
+                    self.update_status("Preview ready, computing ray tracing...")
+                except Exception as e:
+                    print(e)
+            else:
+                self.finish_processing(kind, value)
+                return
+
+        self.after(100, self.poll_messages)
+
+    def finish_processing(self, kind, value):
+        self.calculate_btn.configure(state=tk.NORMAL)
+        self.cancel_btn.configure(state=tk.DISABLED)
+
+        if kind == 'cancelled':
+            self.update_progress(0)
+            self.update_status('Processing cancelled')
+            return
+        if kind == 'error':
+            self.update_status(f'Error processing audio!')
+            print(value)
+            return
+
+        try:
+            self.update_status("Plotting room impulse responses...")
+            self.show_result(value)
+            self.update_progress(100)
             self.update_status('Audio processed!')
         except Exception as e:
             self.update_status(f'Error processing audio!')
             print(e)
 
+    def show_result(self, result, preview=False):
+        # replaces the windows and the audio of the previous (preview) result
+        audio_signal, room, processed_audio = result
+        for window in self.result_windows:
+            if window.winfo_exists():
+                window.destroy()
+        self.result_windows = [plotting_buttons_window(room), plot_signals(audio_signal, processed_audio, room.fs)]
+        if preview:
+            for window in self.result_windows:
+                window.title(window.title() + " (preview)")
+
+        # kept in memory, written to disk only by Export WAV
+        self.shared_data.processed_audio = processed_audio
+        self.shared_data.processed_fs = room.fs
+
+    def cancel_processing(self):
+        # the worker stops at the end of its current stage
+        self.cancel_event.set()
+        self.update_status('Cancelling...')
+
     def play_audio(self):
+        if self.shared_data.processed_audio is None:
+            self.update_status('No processed audio, press Calculate first')
+            return
         try:
             self.update_status('Playing audio...')
-            audio, sample_rate = sf.read('processed.wav')
-            sd.play(audio, sample_rate)
-            sd.wait()
-            self.update_status('Audio played!')
+            self.shared_data.player.play(self.shared_data.processed_audio, self.shared_data.processed_fs, start=self.seek_var.get())
+            self.seek_scale.configure(to=self.shared_data.player.duration)
+            self.after(200, self.update_seek_position)
         except Exception as e:
             self.update_status(f'Error playing audio: {e}')
             print(e)
 
+    def update_seek_position(self):
+        # follow the playback position while playing
+        player = self.shared_data.player
+        if player.is_playing:
+            self.seek_var.set(player.current_time)
+            self.after(200, self.update_seek_position)
+        elif player.current_time >= player.duration:
+            self.seek_var.set(0)
+            self.update_status('Audio played!')
+
+    def seek_audio(self, value):
+        self.shared_data.player.seek(float(value))
+
+    def stop_audio(self):
+        self.shared_data.player.stop()
+        self.update_status('Audio stopped')
+
+    def export_audio(self):
+        if self.shared_data.processed_audio is None:
+            messagebox.showerror("Error", "No processed audio, press Calculate first")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".wav", initialfile="processed.wav", filetypes=[("WAV files", "*.wav")])
+        if not file_path:
+            return
+        try:
+            sf.write(file_path, self.shared_data.processed_audio, self.shared_data.processed_fs)
+            self.update_status(f'Exported {file_path}')
+        except Exception as e:
+            self.update_status(f'Error exporting audio: {e}')
+            print(e)
+
 
 class MainFrame(ttk.Frame):
     def __init__(self, container, shared_data):
@@ -372,7 +576,7 @@ class App(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Room Impulse Response Generator")
-        self.geometry("610x500")
+        self.geometry("700x620")
         self.shared_data = SharedData()
         self.main_frame = MainFrame(self, self.shared_data)
         self.main_frame.pack(fill=tk.BOTH, expand=True)
@@ -384,6 +588,7 @@ class App(tk.Tk):
         self.wait_window()
 
     def on_close(self):
+        self.shared_data.player.stop()
         self.wait_var.set('closed')
         self.destroy()
 
@@ -0,0 +1,94 @@
+import threading
+import numpy as np
+import sounddevice as sd
+
+
+class AudioPlayer:
+    """Non-blocking playback of in-memory audio buffers.
+
+    The samples are pulled by the sounddevice callback from the buffer, so
+    play() returns immediately and the position can be changed while
+    playing.
+    """
+
+    def __init__(self):
+        self.stream = None
+        self.data = None
+        self.fs = None
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def play(self, data: np.ndarray, fs: int, start: float = 0.0):
+        """Start playing a buffer, stops the current one.
+
+        Parameters
+        ----------
+        data : ndarray
+            The audio samples, shape (n_samples,) or (n_samples, n_channels).
+            Only the first channels are played if the output device has
+            fewer.
+        fs : int
+            The sampling frequency.
+        start : float
+            The start position in seconds.
+        """
+        self.stop()
+        data = np.asarray(data, dtype=np.float32)
+        if data.ndim == 1:
+            data = data[:, None]
+        data = data[:, :sd.query_devices(kind='output')['max_output_channels']]
+
+        with self.lock:
+            self.data = data
+            self.fs = fs
+            self.position = min(max(int(start * fs), 0), len(data))
+
+        self.stream = sd.OutputStream(samplerate=fs, channels=data.shape[1], dtype='float32', callback=self._callback)
+        self.stream.start()
+
+    def _callback(self, outdata, frames, time, status):
+        with self.lock:
+            chunk = self.data[self.position:self.position + frames]
+            self.position += len(chunk)
+        outdata[:len(chunk)] = chunk
+        outdata[len(chunk):] = 0
+        if len(chunk) < frames:
+            raise sd.CallbackStop()
+
+    def stop(self):
+        """Stop the playback."""
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def seek(self, seconds: float):
+        """Move the playback position.
+
+        Parameters
+        ----------
+        seconds : float
+            The new position in seconds.
+        """
+        if self.data is None:
+            return
+        with self.lock:
+            self.position = min(max(int(seconds * self.fs), 0), len(self.data))
+
+    @property
+    def is_playing(self):
+        return self.stream is not None and self.stream.active
+
+    @property
+    def current_time(self):
+        """The playback position in seconds."""
+        if self.data is None:
+            return 0.0
+        return self.position / self.fs
+
+    @property
+    def duration(self):
+        """The length of the current buffer in seconds."""
+        if self.data is None:
+            return 0.0
+        return len(self.data) / self.fs
@@ -1,11 +1,15 @@
 import tkinter as tk
+import tkinter.ttk as ttk
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import numpy as np
 import pyfftw
 import pyroomacoustics as pra
-from scipy.signal import freqz, stft
 import scipy.fft
+from freq_response import frequency_responses, spectrograms
+from room_metrics import acoustic_parameters
+from rir_bank import RIRBank, room_bank
+from waveform_lod import plot_waveform
 
 scipy.fft.set_backend(pyfftw.interfaces.scipy_fft)
 
@@ -15,40 +19,79 @@ def plotting_buttons_window(room: pra.Room):
 
     Returns
     -------
-    None
+    plotting_buttons_window : tk.Toplevel
+        The window, to close it when the RIRs are replaced.
 
     """
     mic = 0
-    max_rir_len = max(len(room.rir[mic][src_idx]) for src_idx in range(len(room.sources)))
+    # all the RIRs padded once, the plots take views of it
+    bank = room_bank(room)
     # Create a new window for the plotting buttons
     plotting_buttons_window = tk.Toplevel()
     plotting_buttons_window.title("Plotting Buttons")
 
     # Create a button for plotting the room impulse response
-    plot_rir_button = tk.Button(master=plotting_buttons_window, text="Plot Room Impulse Response", command= lambda: plot_rir(room, mic, max_rir_len))
+    plot_rir_button = tk.Button(master=plotting_buttons_window, text="Plot Room Impulse Response", command= lambda: plot_rir(bank, mic))
     plot_rir_button.pack()
 
     # Create a button for plotting the frequency response
-    plot_freq_resp_button = tk.Button(master=plotting_buttons_window, text="Plot Frequency Response", command= lambda: plot_freq_resp(room, max_rir_len))
+    plot_freq_resp_button = tk.Button(master=plotting_buttons_window, text="Plot Frequency Response", command= lambda: plot_freq_resp(bank))
     plot_freq_resp_button.pack()
 
     # Create a button for plotting the spectrogram
-    plot_spectrogram_button = tk.Button(master=plotting_buttons_window, text="Plot Spectrogram", command= lambda: plot_spectrogram(room, max_rir_len))
+    plot_spectrogram_button = tk.Button(master=plotting_buttons_window, text="Plot Spectrogram", command= lambda: plot_spectrogram(bank))
     plot_spectrogram_button.pack()
 
+    # Create a button for the table of room acoustic parameters
+    parameters_button = tk.Button(master=plotting_buttons_window, text="Show Acoustic Parameters", command= lambda: show_acoustic_parameters(bank))
+    parameters_button.pack()
+
+    return plotting_buttons_window
+
+
+def show_acoustic_parameters(bank: RIRBank):
+    """Show the RT60, EDT, C50, D50 and DRR of every microphone/source pair.
+
+    Parameters
+    ----------
+    bank : RIRBank
+        The RIRs of the room, see rir_bank.room_bank.
+
+    Returns
+    -------
+    None
 
-def plot_rir(room: pra.Room, mic: int, max_rir_len: int):
+    """
+    pairs = [(mic_idx, src_idx) for mic_idx in range(bank.n_mics) for src_idx in range(bank.n_srcs)]
+    # every pair in one batch, same (mic major) order as bank.pairs()
+    parameters = acoustic_parameters(bank.pairs(), bank.fs)
+
+    # Create a new window for the table
+    table_window = tk.Toplevel()
+    table_window.title("Acoustic Parameters")
+
+    columns = ("mic", "source", "rt60", "edt", "c50", "d50", "drr")
+    headings = ("Mic", "Source", "RT60 (s)", "EDT (s)", "C50 (dB)", "D50", "DRR (dB)")
+    table = ttk.Treeview(table_window, columns=columns, show="headings")
+    for column, heading in zip(columns, headings):
+        table.heading(column, text=heading)
+        table.column(column, width=90, anchor=tk.CENTER)
+
+    for i, (mic_idx, src_idx) in enumerate(pairs):
+        values = [f"{parameters[name][i]:.2f}" for name in ("rt60", "edt", "c50", "d50", "drr")]
+        table.insert("", tk.END, values=[f"mic_{mic_idx + 1}", f"src_{src_idx + 1}"] + values)
+    table.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+
+def plot_rir(bank: RIRBank, mic: int):
     """Plot the room impulse response.
     
     Parameters
     ----------
-    room : pyroomacoustics.Room
-        The room object and its properties.
-        Access the room impulse response: room.rir[mic_idx][src_idx]
+    bank : RIRBank
+        The RIRs of the room, see rir_bank.room_bank.
     mic : int
         The microphone index.
-    max_rir_len : int
-        The maximum length of the room impulse response.
 
     Returns
     -------
@@ -63,16 +106,13 @@ def plot_rir(room: pra.Room, mic: int, max_rir_len: int):
 
     # Create a new figure and axes for the plot
     fig, ax = plt.subplots(figsize=(8, 6))
-    # Compute the time axis for the plot
-    t = np.arange(max_rir_len) / room.fs
 
     # Plot the room impulse response on the axes
     try:
-        for src_idx, source in enumerate(room.sources):
-            # pad the rir with zeros if it is shorter than the longest rir
-            if len(room.rir[mic][src_idx]) < max_rir_len:
-                room.rir[mic][src_idx] = np.pad(room.rir[mic][src_idx], (0, max_rir_len - len(room.rir[mic][src_idx])), 'constant')
-            ax.plot(t, room.rir[mic][src_idx], label="Source " + str(src_idx), alpha=0.5)
+        for src_idx in range(bank.n_srcs):
+            # the bank is already padded to the longest rir, long (ray
+            # traced) RIRs are drawn from their min/max envelope
+            plot_waveform(ax, bank.data[mic, src_idx], bank.fs, label="Source " + str(src_idx), alpha=0.5)
     except Exception as e:
         print(e)
         print('Error in plotting the room impulse response')
@@ -85,21 +125,23 @@ def plot_rir(room: pra.Room, mic: int, max_rir_len: int):
 
     # Create a canvas for the plot and add it to the window
     canvas = FigureCanvasTkAgg(fig, master=plot_window)
+    # pan and zoom, the envelopes follow the view
+    NavigationToolbar2Tk(canvas, plot_window).update()
     canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
     # Redraw the canvas to update the figure
     canvas.draw()
 
 
-def plot_freq_resp(room: pra.Room, max_rir_len: int):
+def plot_freq_resp(bank: RIRBank, n_fft: int = None):
     """Plot the frequency response.
 
     Parameters
     ----------
-    room : pyroomacoustics.Room
-        The room object and its properties.
-        Access the room impulse response: room.rir[mic_idx][src_idx]
-    max_rir_len : int
-        The maximum length of the room impulse response.
+    bank : RIRBank
+        The RIRs of the room, see rir_bank.room_bank.
+    n_fft : int, optional
+        The FFT length, the resolution of the responses. Defaults to the
+        RIR length, see freq_response.frequency_responses.
 
     Returns
     -------
@@ -116,13 +158,10 @@ def plot_freq_resp(room: pra.Room, max_rir_len: int):
 
     try:
         # Plot the frequency response on the axes
-        for src_idx, source in enumerate(room.sources):
-            if len(room.rir[0][src_idx]) < max_rir_len:
-                room.rir[0][src_idx] = np.pad(room.rir[0][src_idx], (0, max_rir_len - len(room.rir[0][src_idx])), 'constant')
-            print('Computing the frequency response...')
-            rir = room.rir[0][src_idx] / np.max(np.abs(room.rir[0][src_idx]))
-            freq, resp = freqz(rir) 
-            freq = freq / (2 * np.pi) * room.fs
+        print('Computing the frequency response...')
+        # all the sources in one batch, cached for the next clicks
+        freq, responses = frequency_responses(bank.data[0], bank.fs, n_fft=n_fft)
+        for src_idx, resp in enumerate(responses):
             ax.plot(freq, 20 * np.log10(np.abs(resp)), label="Source " + str(src_idx), alpha=0.5) 
     except Exception as e:
         print(e)
@@ -142,16 +181,17 @@ def plot_freq_resp(room: pra.Room, max_rir_len: int):
     print('Done!')
 
 
-def plot_spectrogram(room: pra.Room, max_rir_len: int, nperseg=256, noverlap=None, cmap='inferno'):
-    """Plot the spectrogram.
+def plot_spectrogram(bank: RIRBank, nperseg=256, noverlap=None, cmap='inferno', dynamic_range=120):
+    """Plot the spectrograms in one window, with a microphone/source selector.
+
+    The spectrograms of every pair are computed in one batched STFT and
+    cached (freq_response.spectrograms), selecting another pair only
+    replaces the image data.
 
     Parameters
     ----------
-    room : pyroomacoustics.Room
-        The room object and its properties.
-        Access the room impulse response: room.rir[mic_idx][src_idx]
-    max_rir_len : int
-        The maximum length of the room impulse response.
+    bank : RIRBank
+        The RIRs of the room, see rir_bank.room_bank.
     nperseg : int, optional
         Length of each segment. Defaults to 256.
     noverlap : int, optional
@@ -159,6 +199,9 @@ def plot_spectrogram(room: pra.Room, max_rir_len: int, nperseg=256, noverlap=Non
         Or nperseg // 2 if noverlap is None.
     cmap : str, optional
         Colormap to use. Defaults to 'inferno'.
+    dynamic_range : float, optional
+        The range of the color scale under the loudest bin, in dB, the same
+        for every pair. Defaults to 120.
 
     Returns
     -------
@@ -168,45 +211,57 @@ def plot_spectrogram(room: pra.Room, max_rir_len: int, nperseg=256, noverlap=Non
 
     print('Starting...')
 
-    if noverlap is None:
-        noverlap = nperseg // 2
-    
-    for src_idx, source in enumerate(room.sources):
-        # Create a new window for the plot
-        plot_window = tk.Toplevel()
-        plot_window.title("Spectrogram")
-
-        # Create a new figure and axes for the plot
-        fig, ax = plt.subplots(figsize=(8, 6))
-        try:
-            # Plot the spectrogram on the axes
-            if len(room.rir[0][src_idx]) < max_rir_len:
-                room.rir[0][src_idx] = np.pad(room.rir[0][src_idx], (0, max_rir_len - len(room.rir[0][src_idx])), 'constant')
-            
-            print('Computing the spectrogram...')
-            # Compute the STFT using scipy.signal.stft with pyfftw as backend
-            f, t, Sxx = stft(room.rir[0][src_idx], room.fs, nperseg=nperseg, noverlap=noverlap)
-
-            pcm = ax.pcolormesh(t, f, 20 * np.log10(np.abs(Sxx)), cmap=cmap, shading='gouraud')
-        except Exception as e:
-            print(e)
-            print('Error in plotting the spectrogram')
-
-        ax.set_xlabel("Time (s)")
-        ax.set_ylabel("Frequency (Hz)")
-        ax.set_title("Spectrogram of mic0")
-        ax.legend()
-        ax.grid(True)  # add grid lines
-
-        # Create a colorbar for the intensity scale
-        fig.colorbar(pcm, ax=ax, label="Magnitude (dB)")
-
-        # Create a canvas for the plot and add it to the window
-        canvas = FigureCanvasTkAgg(fig, master=plot_window)
-        canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
-
-        # Redraw the canvas to update the figure
-        canvas.draw()
-
-        print('Done with source ' + str(src_idx))
+    # Create a new window for the plot
+    plot_window = tk.Toplevel()
+    plot_window.title("Spectrogram")
+
+    # Create a new figure and axes for the plot
+    fig, ax = plt.subplots(figsize=(8, 6))
+    try:
+        print('Computing the spectrograms...')
+        # every pair in one batch, same (mic major) order as bank.pairs()
+        f, t, magnitude_db = spectrograms(bank.pairs(), bank.fs, nperseg=nperseg, noverlap=noverlap)
+    except Exception as e:
+        print(e)
+        print('Error in plotting the spectrogram')
+        plot_window.destroy()
+        return
+
+    vmax = float(magnitude_db.max())
+    image = ax.imshow(magnitude_db[0], cmap=cmap, aspect='auto', origin='lower', interpolation='bilinear',
+                      extent=[t[0], t[-1], f[0], f[-1]], vmin=vmax - dynamic_range, vmax=vmax)
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Frequency (Hz)")
+    ax.grid(True)  # add grid lines
+
+    # Create a colorbar for the intensity scale
+    fig.colorbar(image, ax=ax, label="Magnitude (dB)")
+
+    # Microphone and source selectors
+    selector_frame = tk.Frame(plot_window)
+    selector_frame.pack(side=tk.TOP)
+    mic_var = tk.StringVar(value="mic_1")
+    src_var = tk.StringVar(value="src_1")
+    for label, variable, count, prefix in (("Microphone", mic_var, bank.n_mics, "mic"), ("Source", src_var, bank.n_srcs, "src")):
+        tk.Label(selector_frame, text=label).pack(side=tk.LEFT, padx=5)
+        selector = ttk.Combobox(selector_frame, textvariable=variable, values=[f"{prefix}_{i + 1}" for i in range(count)], state="readonly", width=8)
+        selector.pack(side=tk.LEFT, padx=5)
+
+    # Create a canvas for the plot and add it to the window
+    canvas = FigureCanvasTkAgg(fig, master=plot_window)
+    canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+    def show_pair(*args):
+        mic_idx = int(mic_var.get().split("_")[1]) - 1
+        src_idx = int(src_var.get().split("_")[1]) - 1
+        image.set_data(magnitude_db[mic_idx * bank.n_srcs + src_idx])
+        ax.set_title(f"Spectrogram of mic_{mic_idx + 1}, src_{src_idx + 1}")
+        canvas.draw_idle()
+
+    mic_var.trace_add("write", show_pair)
+    src_var.trace_add("write", show_pair)
+    show_pair()
+
+    # Redraw the canvas to update the figure
+    canvas.draw()
     print('Done!')
@@ -1,127 +1,352 @@
+import os
+import threading
+from collections import OrderedDict
 import numpy as np
-import librosa
-from functions_ import compute_rir, calculate_responses
-from plotting_fcts import plot_rir, plotting_buttons_window
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import tkinter as tk
+import soundfile as sf
+from functions_ import compute_rir, quality_settings
+from rir_bank import room_bank
+from audio_stream import stream_audio_file
+from convolution import fft_convolve, fft_convolve_multi, partitioned_convolve, stream_convolve, precision_dtype
 import pyfftw
 from scipy.signal import stft
 import scipy.fft
 
 scipy.fft.set_backend(pyfftw.interfaces.scipy_fft)
 
-def read_audio_file(file_path, sample_rate=32000):
-    audio, _ = librosa.load(file_path, sr=sample_rate, mono=True)
+# decoded audio shared by the file frame and the pipeline,
+# keyed by (path, mtime, sample rate, mono)
+AUDIO_CACHE_SIZE = 4
+_audio_cache = OrderedDict()
+_audio_loading = {}
+_audio_cache_lock = threading.Lock()
+
+
+def read_audio_file(file_path, sample_rate=32000, mono=True):
+    """Decode and resample an audio file, once per file version.
+
+    The decoded audio is cached (read-only) for the last AUDIO_CACHE_SIZE
+    files. If the same file is being decoded by another thread, wait for it
+    instead of decoding it twice.
+    """
+    path = os.path.abspath(file_path)
+    key = (path, os.path.getmtime(path), sample_rate, mono)
+
+    while True:
+        with _audio_cache_lock:
+            if key in _audio_cache:
+                _audio_cache.move_to_end(key)
+                return _audio_cache[key]
+            loading = _audio_loading.get(key)
+            if loading is None:
+                loading = _audio_loading[key] = threading.Event()
+                break
+        # decoded by another thread, look again once it is done
+        loading.wait()
+
+    try:
+        audio = decode_audio_file(path, sample_rate, mono)
+        audio.flags.writeable = False
+        with _audio_cache_lock:
+            _audio_cache[key] = audio
+            while len(_audio_cache) > AUDIO_CACHE_SIZE:
+                _audio_cache.popitem(last=False)
+        return audio
+    finally:
+        with _audio_cache_lock:
+            del _audio_loading[key]
+        loading.set()
+
+
+def decode_audio_file(file_path, sample_rate=32000, mono=True):
+    """Decode and resample a whole audio file.
+
+    Mono files go through soundfile and the streaming resampler
+    (audio_stream.stream_audio_file), librosa is only used for the
+    formats soundfile can't open, and for multichannel output.
+    """
+    if mono:
+        try:
+            with sf.SoundFile(file_path):
+                pass
+        except RuntimeError:
+            pass # not a soundfile format, see below
+        else:
+            return np.concatenate(list(stream_audio_file(file_path, sample_rate)) or [np.zeros(0, dtype=np.float32)])
+
+    # imported here, only needed for the formats soundfile can't read
+    import librosa
+    audio, _ = librosa.load(file_path, sr=sample_rate, mono=mono)
     return audio
 
 
+def preload_audio_file(file_path, sample_rate=32000, mono=True):
+    """Start decoding an audio file in the background, see read_audio_file."""
+    def load():
+        try:
+            read_audio_file(file_path, sample_rate, mono)
+        except Exception as e:
+            print(e)
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    return thread
+
+
 def apply_rir_to_audio(audio, rir):
-    # Calculate the required size for zero-padding
-    size = len(audio) + len(rir) - 1
+    # Real FFTs at a fast length, see convolution.fft_convolve
+    return fft_convolve(audio, rir)
 
-    # Zero-pad the input signals
-    audio_padded = np.pad(audio, (0, size - len(audio)))
-    rir_padded = np.pad(rir, (0, size - len(rir)))
 
-    # Compute the FFT of the zero-padded input signals
-    audio_fft = scipy.fft.fft(audio_padded)
-    rir_fft = scipy.fft.fft(rir_padded)
+class PipelineCancelled(Exception):
+    """Raised between two stages of the pipeline when the job was cancelled."""
 
-    # Compute the product of the FFTs
-    product_fft = audio_fft * rir_fft
 
-    # Compute the inverse FFT of the product
-    result = scipy.fft.ifft(product_fft)
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise PipelineCancelled()
 
-    return result.real
 
+def auralize(audio_signal, room, convolution_method='fft', block_size=4096, mix_down=True, cancel_event=None, precision='double', workers=None):
+    """Apply the RIRs of every microphone to the audio, one channel per microphone.
 
-def process_audio_with_rir(audio_file_path=str, room_dim=list, absorption=float, max_order=int, mic_positions=dict, src_positions=dict, progress_callback=None, status_callback=None, temperature=float, humidity=float):
-    if status_callback:
-        status_callback("Reading audio file...")
-        progress_callback(0)
+    The RIRs are (n_mics, L) views of the room's RIRBank, one per source
+    (or their mixdown), convolved in one batch: the audio spectrum is
+    computed once and shared by all the channels.
 
-    try:
-        audio_signal = read_audio_file(audio_file_path)
-    except Exception as e:
-        print(e)
+    ``precision`` is 'double' (float64/complex128) or 'single': the
+    convolution and the accumulation then stay in float32/complex64, which
+    halves their memory. ``workers`` is the number of FFTW threads
+    (convolution.FFT_WORKERS if None).
+
+    Returns
+    -------
+    processed_audio : ndarray
+        The audio signal with the room applied, shape (n_samples, n_mics).
+    """
+    rir_bank = room_bank(room)
+    dtype = precision_dtype(precision)
+    check_cancelled(cancel_event)
+
+    # every source plays the same signal: by linearity, convolving once
+    # with the summed RIRs gives the same mix as one convolution per source
+    if mix_down:
+        banks = [rir_bank.mixdown(dtype)]
+    else:
+        banks = [rir_bank.data[:, src_idx] for src_idx in range(rir_bank.n_srcs)]
+
+    processed_audio = np.zeros((rir_bank.n_mics, len(audio_signal) + rir_bank.max_length - 1), dtype=dtype)
+    for bank in banks:
+        if convolution_method == 'partitioned':
+            convolved_audio = partitioned_convolve(audio_signal, bank, block_size, dtype=dtype, workers=workers)
+        else:
+            convolved_audio = fft_convolve_multi(audio_signal, bank, dtype=dtype, workers=workers)
+        processed_audio[:, :convolved_audio.shape[-1]] += convolved_audio
+        check_cancelled(cancel_event)
+
+    # (n_samples, n_channels), the layout of soundfile and sounddevice
+    return processed_audio.T
+
+
+def stream_auralize(audio_file_path, room, block_size=4096, mix_down=True, cancel_event=None, precision='double', output_path=None, workers=None):
+    """Decode, convolve and output the audio block by block.
+
+    The file is decoded and resampled block by block
+    (audio_stream.stream_audio_file) and the blocks go through one
+    partitioned convolver holding the RIRs of every microphone
+    (convolution.stream_convolve), so decoding and convolution overlap.
+    With ``output_path`` the output blocks are written as they come and
+    the memory used doesn't grow with the file.
+
+    Returns
+    -------
+    audio_signal : ndarray or None
+        The original audio signal, None with output_path.
+    processed_audio : ndarray or None
+        The audio signal with the room applied, shape (n_samples, n_mics),
+        None with output_path.
+    """
+    rir_bank = room_bank(room)
+    dtype = precision_dtype(precision)
+    # one channel per microphone, or per (mic, source) pair summed below
+    rirs = rir_bank.mixdown(dtype) if mix_down else rir_bank.pairs()
+    input_blocks = []
+
+    def audio_blocks():
+        for block in stream_audio_file(audio_file_path, room.fs, block_size):
+            check_cancelled(cancel_event)
+            if output_path is None:
+                input_blocks.append(block)
+            yield block
+
+    def output_blocks():
+        for block in stream_convolve(audio_blocks(), rirs, block_size, dtype=dtype, workers=workers):
+            if not mix_down:
+                block = block.reshape(rir_bank.n_mics, rir_bank.n_srcs, -1).sum(axis=1)
+            # (n_samples, n_channels), the layout of soundfile
+            yield block.T
+
+    if output_path is not None:
+        with sf.SoundFile(output_path, 'w', samplerate=room.fs, channels=rir_bank.n_mics) as f:
+            for block in output_blocks():
+                f.write(block)
         return None, None
-    
+
+    processed_audio = np.concatenate(list(output_blocks()))
+    return np.concatenate(input_blocks or [np.zeros(0, dtype=np.float32)]), processed_audio
+
+
+def render_audio_with_rir(audio_file_path, room_dim, absorption, max_order, mic_positions, src_positions, progress_callback=None, status_callback=None, temperature=None, humidity=None, convolution_method='fft', block_size=4096, mix_down=True, cancel_event=None, quality='final', fs=32000, preview_callback=None, precision='double', materials=None, output_path=None, workers=None):
+    """Compute the RIRs and apply them to the audio, without any window.
+
+    Safe to run on a worker thread: errors are raised to the caller, and
+    setting ``cancel_event`` stops the job at the next stage with
+    PipelineCancelled.
+
+    ``fs`` is the sampling frequency of the whole pipeline (RIRs, audio and
+    output). ``quality`` selects a preset of functions_.QUALITY_PRESETS:
+    'draft' lowers fs, max_order and the number of rays for quick previews,
+    'final' keeps them for the export.
+
+    ``precision`` ('double' or 'single') is the precision of the
+    convolution and ``workers`` its number of FFTW threads, see auralize
+    (one per process in a process pool). ``materials`` replaces the default materials,
+    see functions_.compute_rir.
+
+    With ``preview_callback``, a low order image source only result (the
+    'preview' preset, no ray tracing) is computed first and passed to it as
+    (audio_signal, room, processed_audio), before the slower simulation.
+
+    With convolution_method='partitioned' (and no preview), the RIRs are
+    computed first, then the audio is streamed through them
+    (stream_auralize) instead of being decoded whole. With ``output_path``
+    the result is also written to that file, block by block when streaming.
+
+    Returns
+    -------
+    audio_signal : ndarray
+        The original audio signal, None when streamed to output_path.
+    room : pyroomacoustics.Room
+        The room object, access the RIRs: room.rir[mic_idx][src_idx]
+    processed_audio : ndarray
+        The audio signal with the room applied, shape (n_samples, n_mics),
+        None when streamed to output_path.
+    """
+    settings = quality_settings(quality, max_order, fs)
+    auralize_kwargs = dict(convolution_method=convolution_method, block_size=block_size, mix_down=mix_down, cancel_event=cancel_event, precision=precision, workers=workers)
+    # the preview needs the whole audio before the final RIRs
+    streaming = convolution_method == 'partitioned' and preview_callback is None
+
+    if not streaming:
+        if status_callback:
+            status_callback("Reading audio file...")
+            progress_callback(0)
+
+        audio_signal = read_audio_file(audio_file_path, sample_rate=settings['fs'])
+        check_cancelled(cancel_event)
+
+    if preview_callback:
+        if status_callback:
+            status_callback("Computing image source preview...")
+            progress_callback(5)
+
+        # same fs as the final result, so the audio is decoded only once,
+        # and never a higher order than the result that replaces it (draft)
+        preview = quality_settings('preview', settings['max_order'], settings['fs'])
+        room = compute_rir(room_dim, absorption, preview['max_order'], mic_positions, src_positions, temperature=temperature, humidity=humidity, fs=preview['fs'], n_rays=preview['n_rays'], max_rays=preview['max_rays'], materials=materials)
+        check_cancelled(cancel_event)
+        preview_callback((audio_signal, room, auralize(audio_signal, room, **auralize_kwargs)))
+
     if status_callback:
         status_callback("Computing room impulse response...")
         progress_callback(10)
 
-    try:
-        room = compute_rir(room_dim, absorption, max_order, mic_positions, src_positions, audio_signal, temperature=temperature, humidity=humidity)
-    except Exception as e:
-        print(e)
-        return None, None
+    # RIRs only, the audio is convolved below
+    room = compute_rir(room_dim, absorption, settings['max_order'], mic_positions, src_positions, temperature=temperature, humidity=humidity, fs=settings['fs'], n_rays=settings['n_rays'], max_rays=settings['max_rays'], materials=materials)
+    check_cancelled(cancel_event)
 
-    if status_callback:
-        status_callback("Calculating room impulse responses...")
-        progress_callback(50)
+    if streaming:
+        if status_callback:
+            progress_callback(70)
+            status_callback("Streaming audio through the room impulse responses...")
+
+        audio_signal, processed_audio = stream_auralize(audio_file_path, room, block_size=block_size, mix_down=mix_down, cancel_event=cancel_event, precision=precision, output_path=output_path, workers=workers)
+        return audio_signal, room, processed_audio
 
-    try:    
-        rir_responses = calculate_responses(room, mic_positions, src_positions)
-        mic_rirs = rir_responses["mic_1"]
-    
-    except Exception as e:
-        print(e)
-        return None, None
-    
     if status_callback:
-        status_callback("Plotting room impulse responses...")
-        progress_callback(60)
-    
+        progress_callback(70)
+        status_callback("Applying room impulse responses to audio...")
+
+    processed_audio = auralize(audio_signal, room, **auralize_kwargs)
+
+    if output_path is not None:
+        if status_callback:
+            progress_callback(95)
+            status_callback("Writing output...")
+        sf.write(output_path, processed_audio, room.fs)
+
+    return audio_signal, room, processed_audio
+
+
+def plot_signals(audio_signal, processed_audio, fs):
+    """Open the 'Signal' window with the original and processed audio.
+
+    Returns
+    -------
+    window : tk.Toplevel
+        The window, to close it when the plot is replaced.
+    """
+    # imported here, the pipeline above runs without a display (batch_render)
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    import tkinter as tk
+    from waveform_lod import plot_waveform
+
+    window = tk.Toplevel()
+    window.title('Signal')
+
+    fig = plt.figure(figsize=(10, 5))
+    ax = fig.add_subplot(111)
+    # min/max envelopes instead of every sample, redrawn on pan and zoom
+    for mic_idx in range(processed_audio.shape[1]):
+        plot_waveform(ax, processed_audio[:, mic_idx], fs, label=f'Processed signal mic_{mic_idx + 1}', alpha=0.5)
+    plot_waveform(ax, audio_signal, fs, label='Original signal', alpha=0.5)
+    ax.set_xlabel('Time [s]')
+    ax.set_ylabel('Amplitude')
+    ax.set_title('Signal')
+    ax.legend()
+
+    canvas = FigureCanvasTkAgg(fig, master=window)
+    canvas.draw()
+    NavigationToolbar2Tk(canvas, window).update()
+    canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+    canvas.draw()
+    return window
+
+
+def process_audio_with_rir(audio_file_path=str, room_dim=list, absorption=float, max_order=int, mic_positions=dict, src_positions=dict, progress_callback=None, status_callback=None, temperature=float, humidity=float, convolution_method='fft', block_size=4096, mix_down=True, quality='final', fs=32000, precision='double', materials=None):
     try:
-        plotting_buttons_window(room)
+        audio_signal, room, processed_audio = render_audio_with_rir(audio_file_path, room_dim, absorption, max_order, mic_positions, src_positions, progress_callback=progress_callback, status_callback=status_callback, temperature=temperature, humidity=humidity, convolution_method=convolution_method, block_size=block_size, mix_down=mix_down, quality=quality, fs=fs, precision=precision, materials=materials)
     except Exception as e:
         print(e)
         return None, None
 
     if status_callback:
-        progress_callback(70)
-        status_callback("Applying room impulse responses to audio...")
+        status_callback("Plotting room impulse responses...")
+        progress_callback(90)
 
     try:
-        processed_audio = np.zeros(len(audio_signal) + len(mic_rirs[0]) - 1)
-        for rir in mic_rirs:
-            convolved_audio = apply_rir_to_audio(audio_signal, rir)
-            if len(convolved_audio) > len(processed_audio):
-                processed_audio = np.pad(processed_audio, (0, len(convolved_audio) - len(processed_audio)), 'constant')
-            if len(convolved_audio) < len(processed_audio):
-                convolved_audio = np.pad(convolved_audio, (0, len(processed_audio) - len(convolved_audio)), 'constant')
-            processed_audio += convolved_audio
+        from plotting_fcts import plotting_buttons_window
+        plotting_buttons_window(room)
     except Exception as e:
         print(e)
         return None, None
 
-
     if status_callback:
         status_callback("Plotting processed audio...")
         progress_callback(95)
 
     try: 
-        window = tk.Tk()
-        window.title('Signal')
-        
-
-        t2 = np.arange(0, len(audio_signal)/32000, 1/32000)
-        t1 = np.arange(0, len(processed_audio)/32000, 1/32000)
-        fig = plt.figure(figsize=(10, 5))
-        ax = fig.add_subplot(111)
-        ax.plot(t1, processed_audio, label='Processed signal', alpha=0.5)
-        ax.plot(t2, audio_signal, label='Original signal', alpha=0.5)
-        ax.set_xlabel('Time [s]')
-        ax.set_ylabel('Amplitude')
-        ax.set_title('Signal')
-        ax.legend()
-
-        canvas = FigureCanvasTkAgg(fig, master=window)
-        canvas.draw()
-        canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
-        canvas.draw()
+        plot_signals(audio_signal, processed_audio, room.fs)
     except Exception as e:
         print(e)
         return None, None
@@ -0,0 +1,177 @@
+import json
+import os
+import numpy as np
+
+# on-disk bank: a directory with the JSON header and the raw float32 samples
+HEADER_FILE = "header.json"
+DATA_FILE = "rirs.f32"
+
+
+class RIRBank:
+    """All the RIRs of a room in one contiguous float32 array.
+
+    The RIRs are zero-padded to the longest one, so plotting and
+    convolution take views of ``data`` instead of padding room.rir again on
+    every call.
+
+    Parameters
+    ----------
+    data : ndarray
+        The RIRs, shape (n_mics, n_srcs, L).
+    lengths : ndarray
+        The valid length of each RIR, shape (n_mics, n_srcs).
+    fs : int
+        The sampling frequency.
+    scene_hash : str, optional
+        The hash of the scene the RIRs come from, see rir_cache.scene_hash.
+
+    ``data`` can be a np.memmap (see open_bank_file), the views are then
+    read from disk on demand.
+    """
+
+    def __init__(self, data: np.ndarray, lengths: np.ndarray, fs: int, scene_hash: str = None):
+        # a memmap is kept as is (C-ordered float32), so it can be flushed
+        self.data = data if isinstance(data, np.memmap) else np.ascontiguousarray(data, dtype=np.float32)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.fs = fs
+        self.scene_hash = scene_hash
+        self._mixdown = {}
+
+    @classmethod
+    def from_lists(cls, rir: list, fs: int):
+        """Build a bank from ragged lists, format: rir[mic_idx][src_idx]."""
+        lengths = np.array([[len(r) for r in mic_rir] for mic_rir in rir], dtype=np.int64).reshape(len(rir), -1)
+        data = np.zeros(lengths.shape + (int(lengths.max(initial=0)),), dtype=np.float32)
+        for m, mic_rir in enumerate(rir):
+            for s, r in enumerate(mic_rir):
+                data[m, s, :len(r)] = r
+        return cls(data, lengths, fs)
+
+    @classmethod
+    def from_room(cls, room):
+        """Build a bank from the RIRs of a pyroomacoustics room."""
+        return cls.from_lists(room.rir, room.fs)
+
+    @property
+    def n_mics(self):
+        return self.data.shape[0]
+
+    @property
+    def n_srcs(self):
+        return self.data.shape[1]
+
+    @property
+    def max_length(self):
+        return self.data.shape[2]
+
+    def rir(self, mic_idx: int, src_idx: int):
+        """The RIR of a pair without its padding (a view)."""
+        return self.data[mic_idx, src_idx, :self.lengths[mic_idx, src_idx]]
+
+    def pairs(self):
+        """All the RIRs as a (n_mics * n_srcs, L) view, mic major."""
+        return self.data.reshape(-1, self.max_length)
+
+    def mixdown(self, dtype=np.float64):
+        """The RIRs of every microphone summed over the sources.
+
+        Parameters
+        ----------
+        dtype : type
+            The sample type of the sum.
+
+        Returns
+        -------
+        mixdown : ndarray
+            Shape (n_mics, L), computed once per bank and dtype.
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in self._mixdown:
+            mixdown = self.data.sum(axis=1, dtype=dtype)
+            mixdown.flags.writeable = False
+            self._mixdown[dtype] = mixdown
+        return self._mixdown[dtype]
+
+    def save(self, path: str):
+        """Write the bank to a directory, see open_bank_file."""
+        data = create_bank_file(path, self.data.shape, self.fs, self.scene_hash).data
+        data[:] = self.data
+        data.flush()
+        write_bank_header(path, self.data.shape, self.fs, self.lengths, self.scene_hash)
+
+
+def write_bank_header(path: str, shape: tuple, fs: int, lengths: np.ndarray, scene_hash: str = None):
+    """Write the JSON header of an on-disk bank (shape, fs, valid lengths, scene hash)."""
+    header = {
+        'shape': [int(n) for n in shape],
+        'dtype': 'float32',
+        'fs': int(fs),
+        'lengths': np.asarray(lengths).tolist(),
+        'scene_hash': scene_hash,
+    }
+    # write then rename, so a reader never sees a partial header
+    tmp_path = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(header, f)
+    os.replace(tmp_path, os.path.join(path, HEADER_FILE))
+
+
+def create_bank_file(path: str, shape: tuple, fs: int, scene_hash: str = None):
+    """Create an on-disk bank filled with zeros.
+
+    The samples are a np.memmap: writers (e.g. sweep workers, with
+    open_bank_file(path, mode='r+')) fill their rows in place, then the
+    valid lengths are stored with write_bank_header.
+
+    Parameters
+    ----------
+    path : str
+        The bank directory, created if needed.
+    shape : tuple
+        (n_mics, n_srcs, L).
+    fs : int
+        The sampling frequency.
+    scene_hash : str, optional
+        The hash of the scene the RIRs come from.
+
+    Returns
+    -------
+    bank : RIRBank
+        The bank, backed by the writable memmap.
+    """
+    os.makedirs(path, exist_ok=True)
+    data = np.memmap(os.path.join(path, DATA_FILE), dtype=np.float32, mode='w+', shape=tuple(shape))
+    lengths = np.zeros(tuple(shape[:2]), dtype=np.int64)
+    write_bank_header(path, shape, fs, lengths, scene_hash)
+    return RIRBank(data, lengths, fs, scene_hash)
+
+
+def open_bank_file(path: str, mode: str = 'r'):
+    """Open an on-disk bank without reading the samples.
+
+    Parameters
+    ----------
+    path : str
+        The bank directory.
+    mode : str
+        The np.memmap mode, 'r' (read-only) or 'r+' (writable).
+
+    Returns
+    -------
+    bank : RIRBank
+        The bank, its data is a memmap, slices of it are read on demand.
+    """
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        header = json.load(f)
+    shape = tuple(header['shape'])
+    data = np.memmap(os.path.join(path, DATA_FILE), dtype=header['dtype'], mode=mode, shape=shape)
+    lengths = np.array(header['lengths'], dtype=np.int64).reshape(shape[:2])
+    return RIRBank(data, lengths, header['fs'], header['scene_hash'])
+
+
+def room_bank(room):
+    """The RIRBank of a room, built once and kept as room.rir_bank."""
+    bank = getattr(room, 'rir_bank', None)
+    if bank is None:
+        bank = room.rir_bank = RIRBank.from_room(room)
+    return bank
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "modelisation_acoustique", "rir")
+DEFAULT_MAX_BYTES = 512 * 2**20
+
+
+def scene_hash(scene: dict):
+    """Hash a scene description into a cache key.
+
+    Parameters
+    ----------
+    scene : dict
+        Everything the RIRs depend on (geometry, materials, positions,
+        fs, simulation settings...). Values must be JSON serializable,
+        numpy arrays and scalars are converted.
+
+    Returns
+    -------
+    key : str
+        The SHA-256 hex digest of the canonical JSON of the scene.
+    """
+    canonical = json.dumps(scene, sort_keys=True, separators=(",", ":"), default=lambda o: np.asarray(o).tolist())
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class RIRCache:
+    """On-disk cache of RIR banks, keyed by scene hash.
+
+    Each bank is a compressed .npz file. The least recently used files are
+    removed when the directory grows over ``max_bytes``.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The cache directory, created on first write.
+    max_bytes : int
+        The maximum size of the cache directory.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path(self, key: str):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, key: str):
+        """Load a RIR bank.
+
+        Parameters
+        ----------
+        key : str
+            The scene hash.
+
+        Returns
+        -------
+        rir : list or None
+            The RIRs, format: rir[mic_idx][src_idx], None if not cached.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                n_mics, n_srcs = data["shape"]
+                rir = [[data[f"rir_{m}_{s}"] for s in range(n_srcs)] for m in range(n_mics)]
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # mark as recently used
+        os.utime(path)
+        return rir
+
+    def put(self, key: str, rir: list):
+        """Store a RIR bank, then evict the least recently used ones.
+
+        Parameters
+        ----------
+        key : str
+            The scene hash.
+        rir : list
+            The RIRs, format: rir[mic_idx][src_idx].
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        arrays = {f"rir_{m}_{s}": r for m, mic_rir in enumerate(rir) for s, r in enumerate(mic_rir)}
+        shape = np.array([len(rir), len(rir[0]) if rir else 0])
+
+        # write then rename, so a reader never sees a partial file
+        # (one temporary file per process, batch_render writes in parallel)
+        tmp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, shape=shape, **arrays)
+        os.replace(tmp_path, self.path(key))
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used banks until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass # evicted by another process
+            total -= size
+
+
+default_cache = RIRCache()
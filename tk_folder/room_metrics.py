@@ -0,0 +1,145 @@
+import numpy as np
+import scipy.signal as signal
+from functions_ import stack_rirs
+
+# the parameters returned by acoustic_parameters
+METRICS = ('rt60', 'edt', 'c50', 'd50', 'drr')
+OCTAVE_BANDS = [125, 250, 500, 1000, 2000, 4000]
+
+
+def octave_band_filter(bank: np.ndarray, fs: int, bands: list):
+    """Split RIRs into octave bands.
+
+    Parameters
+    ----------
+    bank : ndarray
+        The RIRs, shape (n_rirs, L).
+    fs : int
+        The sampling frequency.
+    bands : list
+        The center frequencies of the octave bands.
+
+    Returns
+    -------
+    filtered : ndarray
+        The band-passed RIRs, shape (n_rirs, len(bands), L).
+    """
+    filtered = np.empty((len(bank), len(bands), bank.shape[-1]))
+    for b, fc in enumerate(bands):
+        # 4th order Butterworth over the octave, kept under Nyquist
+        sos = signal.butter(4, [fc / np.sqrt(2), min(fc * np.sqrt(2), 0.99 * fs / 2)], btype='bandpass', fs=fs, output='sos')
+        filtered[:, b] = signal.sosfilt(sos, bank, axis=-1)
+    return filtered
+
+
+def schroeder_decay(energy: np.ndarray):
+    """Schroeder backward integration of the squared RIRs along the last axis.
+
+    Returns
+    -------
+    edc_db : ndarray
+        The energy decay curves in dB, 0 dB at the first sample.
+    """
+    edc = np.cumsum(energy[..., ::-1], axis=-1)[..., ::-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 10 * np.log10(edc / edc[..., :1])
+
+
+def _decay_time(edc_db, t, start_db, stop_db):
+    # least squares line over [start_db, stop_db] of every curve (t >= 0),
+    # extrapolated to -60 dB
+    mask = (edc_db <= start_db) & (edc_db >= stop_db) & (t >= 0)
+    n = mask.sum(axis=-1)
+    st = np.sum(np.where(mask, t, 0), axis=-1)
+    stt = np.sum(np.where(mask, t * t, 0), axis=-1)
+    sx = np.sum(np.where(mask, edc_db, 0), axis=-1)
+    stx = np.sum(np.where(mask, t * edc_db, 0), axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * stx - st * sx) / (n * stt - st * st)
+        decay_time = -60 / slope
+    # not enough points, or the curve never reaches stop_db
+    reached = np.min(edc_db, axis=-1) <= stop_db
+    return np.where((n >= 2) & reached, decay_time, np.nan)
+
+
+def _parameters(x, fs, onset):
+    # x: (n_rirs, n_bands, L), onset: (n_rirs,) index of the direct sound
+    length = x.shape[-1]
+    idx = np.arange(length)
+    after_onset = idx >= onset[:, None, None]
+    energy = np.where(after_onset, x * x, 0)
+    t = (idx - onset[:, None, None]) / fs
+
+    edc_db = schroeder_decay(energy)
+    cumulative = np.cumsum(energy, axis=-1)
+    total = cumulative[..., -1]
+
+    def energy_until(n_samples):
+        # energy from the direct sound to n_samples after it
+        end = np.minimum(onset + n_samples, length - 1)
+        return np.take_along_axis(cumulative, np.broadcast_to(end[:, None, None], x.shape[:-1] + (1,)), axis=-1)[..., 0]
+
+    early = energy_until(int(round(0.05 * fs)) - 1)
+    direct = energy_until(int(round(0.0025 * fs)))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'rt60': _decay_time(edc_db, t, -5, -35),
+            'edt': _decay_time(edc_db, t, 0, -10),
+            'c50': 10 * np.log10(early / (total - early)),
+            'd50': early / total,
+            'drr': 10 * np.log10(direct / (total - direct)),
+        }
+
+
+def acoustic_parameters(rirs, fs: int, bands: list = None, chunk_size: int = 64):
+    """Room acoustic parameters of a whole bank of RIRs.
+
+    The RIRs are zero-padded into a (n_rirs, L) array and processed
+    ``chunk_size`` rows at a time: Schroeder backward integration with a
+    reversed cumsum, then vectorized least squares fits of the decay.
+    Times start at the direct sound, the first sample of each RIR within
+    20 dB of its peak.
+
+    - rt60: reverberation time from the -5 to -35 dB decay (T30), in s
+    - edt: early decay time from the 0 to -10 dB decay, in s
+    - c50: clarity, early (50 ms) to late energy ratio, in dB
+    - d50: definition, early (50 ms) to total energy ratio
+    - drr: direct (2.5 ms) to reverberant energy ratio, in dB
+
+    Parameters
+    ----------
+    rirs : list or ndarray
+        The room impulse responses, a list of 1-D arrays or a (n_rirs, L)
+        array.
+    fs : int
+        The sampling frequency.
+    bands : list, optional
+        Octave band center frequencies (e.g. OCTAVE_BANDS), the parameters
+        are then computed per band.
+    chunk_size : int
+        The number of RIRs per batch, bounds the memory used.
+
+    Returns
+    -------
+    parameters : dict
+        One array per name of METRICS, shape (n_rirs,) or
+        (n_rirs, len(bands)). NaN where the decay is too short to fit.
+    """
+    bank = rirs if isinstance(rirs, np.ndarray) else stack_rirs(rirs)
+    shape = (len(bank),) if bands is None else (len(bank), len(bands))
+    parameters = {name: np.full(shape, np.nan) for name in METRICS}
+
+    for start in range(0, len(bank), chunk_size):
+        chunk = bank[start:start + chunk_size]
+        # direct sound: first sample within 20 dB of the peak (ISO 3382-1),
+        # later reflections can be louder than the direct path
+        magnitude = np.abs(chunk)
+        onset = np.argmax(magnitude >= 0.1 * np.max(magnitude, axis=-1, keepdims=True), axis=-1)
+        x = chunk[:, None, :] if bands is None else octave_band_filter(chunk, fs, bands)
+
+        for name, values in _parameters(x, fs, onset).items():
+            parameters[name][start:start + len(chunk)] = values[:, 0] if bands is None else values
+
+    return parameters
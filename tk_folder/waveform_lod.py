@@ -0,0 +1,115 @@
+import numpy as np
+
+
+class WaveformLOD:
+    """Min/max envelope pyramid of a waveform, for plots of long signals.
+
+    Level k holds the min and max of blocks of factor**k samples, so any
+    view of the signal can be drawn from about two points per pixel column
+    (the min and max of the samples under it) instead of every sample.
+
+    Parameters
+    ----------
+    samples : ndarray
+        The waveform, 1-D.
+    fs : int
+        The sampling frequency.
+    factor : int
+        The block size ratio between two levels. The pyramid takes
+        2 / (factor - 1) times the memory of the signal.
+    """
+
+    def __init__(self, samples: np.ndarray, fs: int, factor: int = 4):
+        self.samples = np.asarray(samples)
+        self.fs = fs
+        # (block size, mins, maxs), finest first, level 0 is the signal
+        self.levels = [(1, self.samples, self.samples)]
+        mins = maxs = self.samples
+        block = 1
+        while len(mins) > factor:
+            starts = np.arange(0, len(mins), factor)
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+            block *= factor
+            self.levels.append((block, mins, maxs))
+
+    def __len__(self):
+        return len(self.samples)
+
+    def envelope(self, t_start: float, t_stop: float, n_bins: int):
+        """The points to draw between two times.
+
+        Parameters
+        ----------
+        t_start, t_stop : float
+            The time range, in s.
+        n_bins : int
+            The number of bins, e.g. the width of the axes in pixels.
+
+        Returns
+        -------
+        t : ndarray
+            The times of the points, in s.
+        y : ndarray
+            The min and max of each bin in turn, or the samples themselves
+            when there are fewer than 2 per bin. At most 2 * n_bins points.
+        """
+        start = max(int(np.floor(t_start * self.fs)), 0)
+        stop = min(int(np.ceil(t_stop * self.fs)) + 1, len(self))
+        n_bins = max(int(n_bins), 1)
+        if stop <= start:
+            return np.zeros(0), self.samples[:0]
+
+        samples_per_bin = (stop - start) / n_bins
+        if samples_per_bin <= 2:
+            return np.arange(start, stop) / self.fs, self.samples[start:stop]
+
+        # coarsest level with at least one block per bin
+        block, mins, maxs = [level for level in self.levels if level[0] <= samples_per_bin][-1]
+        first, last = start // block, -(-stop // block)
+        edges = np.unique(np.linspace(first, last, n_bins + 1).astype(int))[:-1]
+        lo = np.minimum.reduceat(mins[first:last], edges - first)
+        hi = np.maximum.reduceat(maxs[first:last], edges - first)
+
+        t = np.repeat(edges * block / self.fs, 2)
+        return t, np.column_stack([lo, hi]).ravel()
+
+
+def plot_waveform(ax, samples: np.ndarray, fs: int, **kwargs):
+    """Plot a waveform from its min/max envelope, redrawn on pan and zoom.
+
+    Only about two points per pixel column of the axes are drawn. They are
+    computed again from the WaveformLOD pyramid when the x limits or the
+    size of the axes change.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        The axes, the time axis is in s.
+    samples : ndarray
+        The waveform, 1-D.
+    fs : int
+        The sampling frequency.
+    **kwargs
+        Passed to ax.plot (label, alpha...).
+
+    Returns
+    -------
+    line : matplotlib.lines.Line2D
+        The line of the waveform.
+    """
+    lod = WaveformLOD(samples, fs)
+
+    def width():
+        return ax.get_window_extent().width
+
+    line, = ax.plot(*lod.envelope(0, len(lod) / fs, width()), **kwargs)
+
+    def update(*args):
+        t_start, t_stop = ax.get_xlim()
+        line.set_data(*lod.envelope(t_start, t_stop, width()))
+        ax.figure.canvas.draw_idle()
+
+    ax.callbacks.connect('xlim_changed', update)
+    ax.figure.canvas.mpl_connect('resize_event', update)
+    return line